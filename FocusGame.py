@@ -2,73 +2,579 @@
 # Date: November 25, 2020
 
 # Required Moduels
+import random
+import struct
+import sys
+import time
+from array import array
+from collections import deque, namedtuple
+from enum import Enum
+
+# move directions as (row, column) steps
+DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+# second byte of the side to move in a to_bytes record
+# before the first move
+NO_TURN = 2
+
+# Zobrist keys are drawn from a seeded generator
+# so hashes agree between processes
+ZOBRIST_SEED = 20201125
+
+# evaluation features kept up to date by every move, stored
+# as one int with FEATURE_BITS bits per feature per side
+FEATURE_NAMES = ("controlled", "pawns", "tall_stacks", "mobility")
+FEATURE_BITS = 16
+FEATURE_MASK = (1 << FEATURE_BITS) - 1
+TALL_STACK = 4
+Features = namedtuple("Features", FEATURE_NAMES)
+
+# moves between the position checkpoints of the move log
+CHECKPOINT_INTERVAL = 16
+
+# a change of position sent to listeners (see add_listener): the
+# move number after it, the action number of the move (None when
+# a move was taken back), the (square, packed stack) pairs of the
+# squares changed, the reserves and captures of p1 and p2 as
+# (reserve 1, reserve 2, captured 1, captured 2), the side to move
+# and the game over flag
+Delta = namedtuple("Delta", ("move_number", "action", "squares", "counters", "turn", "game_over"))
+
+# action number of a taken back move in an encoded delta
+NO_ACTION = 0xFFFF
+
+# largest rules: the reserves and captures of a record are
+# bytes, and a packed stack with its height fits 64 bits
+MAX_BOARD_SIZE = 22
+MAX_STACK_LIMIT = 58
+
+# undo stack of games with an undo limit of 0, it
+# drops every entry so all of them can share it
+NO_UNDO = deque(maxlen=0)
+
+# widest stacks kept in fully built lookup tables,
+# wider ones fill their tables as stacks are seen
+MAX_TABLE_BITS = 12
+
+
+class LazyTable(dict):
+    """
+    Represents a lookup table indexed like a list
+    that builds each entry the first time it is used
+    """
+
+    def __init__(self, build):
+        """
+        Creates the table, build(key) returns an entry
+        """
+        super().__init__()
+        self._build = build
+
+    def __missing__(self, key):
+        value = self._build(key)
+        self[key] = value
+        return value
+
 
 # Class Definitions
-class Pawn:
+class MoveResult(Enum):
+    """
+    Represents the outcome of validate_move, OK
+    or the first reason the move is not legal
+    """
+    OK = "ok"
+    UNKNOWN_PLAYER = "unknown_player"
+    GAME_OVER = "game_over"
+    WRONG_TURN = "wrong_turn"
+    OUT_OF_BOUNDS = "out_of_bounds"
+    EMPTY_START = "empty_start"
+    NOT_ORTHOGONAL = "not_orthogonal"
+    NOT_TOP_COLOR = "not_top_color"
+    NO_PAWNS = "no_pawns"
+    TOO_MANY_PAWNS = "too_many_pawns"
+    OVER_STACK_LIMIT = "over_stack_limit"
+    WRONG_DISTANCE = "wrong_distance"
+    RESERVE_FIRST_MOVE = "reserve_first_move"
+    RESERVE_OCCUPIED = "reserve_occupied"
+    RESERVE_EMPTY = "reserve_empty"
+
+
+class GameRules:
     """
-    Represents player pawn for game
-    Focus/Domination
+    Represents the rules a game is played with: the
+    board size, the most pawns a stack may hold and the
+    captures needed to win. Everything the move code looks
+    up (move rays, the packed stack layout, Zobrist keys,
+    feature tables) is built once per rule set, so use
+    get_rules to share them between games. The tables are
+    read-only attributes: positions, rays, height_bits,
+    height_mask, typecode, record_size, reserve_actions,
+    num_actions, stack_actions, pawns_per_player, pawn_keys, stack_keys,
+    reserve_keys, captured_keys, turn_keys and cell_features
     """
 
-    def __init__(self, color):
+    def __init__(self, board_size=6, stack_limit=5, win_captures=6):
+        """
+        Builds the tables for the rules, raises
+        ValueError for parameters out of range
+        """
+        squares = board_size * board_size
+        if not 2 <= board_size <= MAX_BOARD_SIZE:
+            raise ValueError("board size must be from 2 to {}".format(MAX_BOARD_SIZE))
+        if not 1 <= stack_limit <= MAX_STACK_LIMIT:
+            raise ValueError("stack limit must be from 1 to {}".format(MAX_STACK_LIMIT))
+        if not 1 <= win_captures <= (squares + 1) // 2:
+            raise ValueError("win captures must be from 1 to {}".format((squares + 1) // 2))
+        if squares * (len(DIRECTIONS) * stack_limit + 1) >= NO_ACTION:
+            # action numbers are kept as 16 bits below NO_ACTION
+            raise ValueError("board size and stack limit give too many action numbers")
+        self._board_size = board_size
+        self._stack_limit = stack_limit
+        self._win_captures = win_captures
+
+        # square index (row * size + column) to position tuple
+        self.positions = [(x, y) for x in range(board_size) for y in range(board_size)]
+
+        # packed stacks: the low bits hold the height, then one
+        # color bit per pawn from the bottom up, in the smallest
+        # array item that fits
+        self.height_bits = stack_limit.bit_length()
+        self.height_mask = (1 << self.height_bits) - 1
+        cell_bits = self.height_bits + stack_limit
+        for typecode in "BHLQ":
+            if array(typecode).itemsize * 8 >= cell_bits:
+                self.typecode = typecode
+                break
+
+        # to_bytes record: the packed stacks, reserves, captures, side
+        # to move (NO_TURN before the first move) and game over
+        self.record_size = squares * array(self.typecode).itemsize + 6
+
+        # moves are numbered (start * 4 + direction) * stack_limit
+        # + num_pawns - 1, followed by one reserve placement per square
+        self.reserve_actions = squares * len(DIRECTIONS) * stack_limit
+        self.num_actions = self.reserve_actions + squares
+        self.rays = self._build_rays()
+
+        # action number of the stack move from start to end
+        # (the distance is the number of pawns) at index
+        # start * squares + end, None where there is no move
+        self.stack_actions = [None] * (squares * squares)
+        for action in range(self.reserve_actions):
+            start_pos, end_pos, num_pawns = self.index_to_move(action)
+            if 0 <= end_pos[0] < board_size and 0 <= end_pos[1] < board_size:
+                start = start_pos[0] * board_size + start_pos[1]
+                self.stack_actions[start * squares + end_pos[0] * board_size + end_pos[1]] = action
+
+        # Zobrist keys, drawn in the same order for every rule
+        # set so the standard game keeps its hashes
+        # the first player has the extra pawn on odd boards
+        zobrist_random = random.Random(ZOBRIST_SEED)
+        self.pawns_per_player = (squares + 1) // 2
+        self.pawn_keys = [[[zobrist_random.getrandbits(64) for bit in range(2)]
+                           for level in range(stack_limit)]
+                          for square in range(squares)]
+        self.reserve_keys = [[zobrist_random.getrandbits(64) for count in range(self.pawns_per_player + 1)]
+                             for side in range(2)]
+        self.captured_keys = [[zobrist_random.getrandbits(64) for count in range(self.pawns_per_player + 1)]
+                              for side in range(2)]
+        self.turn_keys = [zobrist_random.getrandbits(64) for side in range(2)]
+
+        # per square tables of every packed stack value
+        self._mobility = [[len([end for num_pawns, end in self.rays[square] if num_pawns <= height])
+                           for height in range(stack_limit + 1)]
+                          for square in range(squares)]
+        self.stack_keys = [self._build_table(square, self._stack_key) for square in range(squares)]
+        self.cell_features = [self._build_table(square, self._cell_features) for square in range(squares)]
+
+    def __reduce__(self):
+        """
+        Pickles the rules by their parameters,
+        the tables are rebuilt by get_rules
+        """
+        return get_rules, (self._board_size, self._stack_limit, self._win_captures)
+
+    def __eq__(self, other):
+        return isinstance(other, GameRules) and self.get_key() == other.get_key()
+
+    def __hash__(self):
+        return hash(self.get_key())
+
+    def get_key(self):
+        """
+        Returns the (board size, stack limit, win captures) tuple
+        """
+        return self._board_size, self._stack_limit, self._win_captures
+
+    def get_board_size(self):
+        """
+        Returns the number of rows (and columns)
+        """
+        return self._board_size
+
+    def get_stack_limit(self):
+        """
+        Returns the most pawns a stack may hold
+        """
+        return self._stack_limit
+
+    def get_win_captures(self):
+        """
+        Returns the captures needed to win
+        """
+        return self._win_captures
+
+    def new_cells(self):
+        """
+        Returns an empty board of packed stacks,
+        a bytearray when a stack fits in a byte
+        """
+        squares = self._board_size * self._board_size
+        if self.typecode == "B":
+            return bytearray(squares)
+        return array(self.typecode, bytes(squares * array(self.typecode).itemsize))
+
+    def move_to_index(self, move):
+        """
+        Returns the action number of a move given as
+        (start_pos, end_pos, num_pawns) or (None, location, 1)
+        """
+        start_pos, end_pos, num_pawns = move
+        if start_pos is None:
+            return self.reserve_actions + end_pos[0] * self._board_size + end_pos[1]
+        dx = end_pos[0] - start_pos[0]
+        dy = end_pos[1] - start_pos[1]
+        direction = DIRECTIONS.index(((dx > 0) - (dx < 0), (dy > 0) - (dy < 0)))
+        start = start_pos[0] * self._board_size + start_pos[1]
+        return (start * len(DIRECTIONS) + direction) * self._stack_limit + num_pawns - 1
+
+    def index_to_move(self, index):
+        """
+        Returns the move for an action number,
+        the inverse of move_to_index
+        """
+        if index >= self.reserve_actions:
+            return (None, self.positions[index - self.reserve_actions], 1)
+        start, rest = divmod(index, len(DIRECTIONS) * self._stack_limit)
+        direction, num_pawns = divmod(rest, self._stack_limit)
+        num_pawns += 1
+        x, y = self.positions[start]
+        dx, dy = DIRECTIONS[direction]
+        return ((x, y), (x + dx * num_pawns, y + dy * num_pawns), num_pawns)
+
+    def _build_rays(self):
         """
-        Creates instance of Pawn with
-        color, top, and bottom assignments
+        Returns the move ray table, for every square
+        a list of (num_pawns, end square) pairs in each
+        direction that stays on the board, sorted by
+        the number of pawns moved
         """
-        self._color = color
-        self._top = True
-        self._bottom = True
+        size = self._board_size
+        rays = []
+        for x, y in self.positions:
+            ray = []
+            for num_pawns in range(1, self._stack_limit + 1):
+                for dx, dy in DIRECTIONS:
+                    end_x = x + dx * num_pawns
+                    end_y = y + dy * num_pawns
+                    if 0 <= end_x < size and 0 <= end_y < size:
+                        ray.append((num_pawns, end_x * size + end_y))
+            rays.append(ray)
+        return rays
+
+    def _build_table(self, square, entry):
+        """
+        Returns the table of entry(square, cell) for every
+        packed stack, built lazily for wide stacks
+        """
+        cell_bits = self.height_bits + self._stack_limit
+        if cell_bits > MAX_TABLE_BITS:
+            return LazyTable(lambda cell: entry(square, cell))
+        return [entry(square, cell) for cell in range(1 << cell_bits)]
+
+    def _stack_key(self, square, cell):
+        """
+        Returns the Zobrist key of a packed stack,
+        the xor of the keys of the pawns in it
+        """
+        height = cell & self.height_mask
+        colors = cell >> self.height_bits
+        key = 0
+        if height > self._stack_limit or colors >> height:
+            return key
+        for level in range(height):
+            key ^= self.pawn_keys[square][level][(colors >> level) & 1]
+        return key
+
+    def _cell_features(self, square, cell):
+        """
+        Returns the packed feature counts of a packed
+        stack: the square controlled by the top color,
+        the pawns of each color, a tall stack (TALL_STACK
+        or more pawns) for the top color and the stack
+        moves the top color can make from the square
+        """
+        height = cell & self.height_mask
+        colors = cell >> self.height_bits
+        if height == 0 or height > self._stack_limit or colors >> height:
+            return 0
+        top = (colors >> (height - 1)) & 1
+        second_color = bin(colors).count("1")
+        counts = [[0] * len(FEATURE_NAMES) for side in range(2)]
+        counts[top][0] = 1
+        counts[0][1] = height - second_color
+        counts[1][1] = second_color
+        counts[top][2] = int(height >= TALL_STACK)
+        counts[top][3] = self._mobility[square][height]
+        value = 0
+        for side in range(2):
+            for feature, count in enumerate(counts[side]):
+                value += count << (FEATURE_BITS * (side * len(FEATURE_NAMES) + feature))
+        return value
+
+
+_rules_cache = {}
+
+
+def get_rules(board_size=6, stack_limit=5, win_captures=6):
+    """
+    Returns the GameRules for the parameters, built
+    the first time they are asked for and shared after
+    """
+    key = (board_size, stack_limit, win_captures)
+    if key not in _rules_cache:
+        _rules_cache[key] = GameRules(board_size, stack_limit, win_captures)
+    return _rules_cache[key]
+
+
+# the standard 6x6 game, its tables are also
+# available as module constants
+STANDARD_RULES = get_rules()
+BOARD_SIZE = 6
+STACK_LIMIT = 5
+WIN_CAPTURES = 6
+HEIGHT_BITS = STANDARD_RULES.height_bits
+HEIGHT_MASK = STANDARD_RULES.height_mask
+POSITIONS = STANDARD_RULES.positions
+RESERVE_ACTIONS = STANDARD_RULES.reserve_actions
+NUM_ACTIONS = STANDARD_RULES.num_actions
+
+
+def move_to_index(move):
+    """
+    Returns the action number of a move
+    under the standard rules
+    """
+    return STANDARD_RULES.move_to_index(move)
+
+
+def index_to_move(index):
+    """
+    Returns the move for an action number
+    under the standard rules
+    """
+    return STANDARD_RULES.index_to_move(index)
+
+
+_delta_formats = {}
+
+
+def delta_formats(rules):
+    """
+    Returns the struct formats of an encoded delta under
+    the rules: the header (move number, action and number
+    of squares), one square (its index and packed stack)
+    and the counters, turn and game over flag
+    """
+    formats = _delta_formats.get(rules)
+    if formats is None:
+        square_format = "B" if rules.get_board_size() ** 2 <= 256 else "H"
+        cell_format = {1: "B", 2: "H", 4: "I", 8: "Q"}[array(rules.typecode).itemsize]
+        formats = (struct.Struct("<HHB"), struct.Struct("<" + square_format + cell_format), struct.Struct("<6B"))
+        _delta_formats[rules] = formats
+    return formats
+
+
+def encode_delta(delta, rules=STANDARD_RULES):
+    """
+    Returns a Delta as little endian bytes (15 bytes
+    for a stack move in the standard game)
+    """
+    header, square, tail = delta_formats(rules)
+    action = NO_ACTION if delta.action is None else delta.action
+    turn = NO_TURN if delta.turn is None else delta.turn
+    parts = [header.pack(delta.move_number, action, len(delta.squares))]
+    parts.extend(square.pack(index, cell) for index, cell in delta.squares)
+    parts.append(tail.pack(*delta.counters, turn, int(delta.game_over)))
+    return b"".join(parts)
+
+
+def decode_delta(data, rules=STANDARD_RULES):
+    """
+    Returns the Delta of bytes made by encode_delta,
+    raises ValueError if the bytes are not a delta
+    """
+    header, square, tail = delta_formats(rules)
+    try:
+        move_number, action, count = header.unpack_from(data)
+        squares = tuple(square.unpack_from(data, header.size + index * square.size) for index in range(count))
+        values = tail.unpack_from(data, header.size + count * square.size)
+    except struct.error:
+        raise ValueError("not an encoded delta")
+    if len(data) != header.size + count * square.size + tail.size:
+        raise ValueError("not an encoded delta")
+    return Delta(move_number, None if action == NO_ACTION else action, squares,
+                 values[:4], None if values[4] == NO_TURN else values[4], bool(values[5]))
+
+
+# stack views by packed stack value, shared by every
+# board with the same (rules, colors)
+_stack_views = {}
+
+
+class Board:
+    """
+    Represents the game board as packed stacks, one
+    array item per square (one byte in the standard
+    game). The low bits of a square hold the height
+    of the stack (3 bits for 5 pawns) and the bits
+    above hold the pawn colors from the bottom up
+    (bit 0 is the first player's color, bit 1 is
+    the second player's color)
+    """
 
-    def set_top(self, pawn):
+    def __init__(self, colors, rules=STANDARD_RULES):
         """
-        Set new pawn as the top in a stack
+        Creates an empty board for the
+        two colors given as a tuple
+        ex: ("R", "G")
         """
-        self._top = pawn
+        self._colors = colors
+        self._size = rules.get_board_size()
+        self._height_bits = rules.height_bits
+        self._height_mask = rules.height_mask
+        self._cells = rules.new_cells()
+        # shared stack views by packed stack value, then once
+        # rendered the text of every row with the cells it was
+        # made from and the last full render with its position
+        self._views = _stack_views.setdefault((rules, colors), {})
+        self._rows = None
+        self._render = None
 
-    def set_bottom(self, pawn):
+    def get_cells(self):
         """
-        Set new pawn as the bottom in a stack
+        Returns the packed stacks, indexed
+        by row * board size + column
         """
-        self._bottom = pawn
+        return self._cells
 
-    def get_top(self):
+    def get_colors(self):
         """
-        Returns the top of the stack
+        Returns the colors of the pawns
+        indexed by their color bit
         """
-        return self._top
+        return self._colors
 
-    def get_bottom(self):
+    def get_color_bit(self, color):
         """
-        Returns the bottom of the stack
+        Returns the color bit used to
+        store pawns of the given color
         """
-        return self._bottom
+        return self._colors.index(color)
 
-    def get_color(self):
+    def get_height(self, position):
         """
-        Return the color of the pawn
+        Returns the number of pawns in
+        the stack at the position
         """
-        return self._color
+        return self._cells[position[0] * self._size + position[1]] & self._height_mask
+
+    def get_top_color(self, position):
+        """
+        Returns the color of the pawn at
+        the top of the stack, or None if
+        the square is empty
+        """
+        cell = self._cells[position[0] * self._size + position[1]]
+        height = cell & self._height_mask
+        if height == 0:
+            return None
+        return self._colors[(cell >> (self._height_bits + height - 1)) & 1]
+
+    def get_stack(self, position):
+        """
+        Returns the list of colors in the stack
+        starting with the bottom pawn
+        """
+        return list(self.get_stack_view(position))
+
+    def get_stack_view(self, position):
+        """
+        Returns the colors in the stack starting with
+        the bottom pawn as a shared tuple, made once
+        per packed stack value rather than per call
+        """
+        return self._cell_view(self._cells[position[0] * self._size + position[1]])
+
+    def _cell_view(self, cell):
+        """
+        Returns the tuple of colors of a packed stack
+        """
+        view = self._views.get(cell)
+        if view is None:
+            colors = cell >> self._height_bits
+            view = tuple(self._colors[(colors >> i) & 1] for i in range(cell & self._height_mask))
+            self._views[cell] = view
+        return view
 
-    def make_bottom(self):
+    def render(self):
         """
-        Make pawn the bottom of the stack
+        Returns the board as text, one line per row
+        with the top color of every stack (X if empty)
+        followed by a space. The text is reused while
+        the position is unchanged and only the rows
+        whose squares changed are rendered again
         """
-        self._bottom = True
+        key = self.to_bytes()
+        if self._render is not None and self._render[0] == key:
+            return self._render[1]
+        size = self._size
+        cells = self._cells
+        if self._rows is None:
+            self._rows = [None] * size
+        lines = []
+        for x in range(size):
+            row = cells[x * size:(x + 1) * size]
+            cached = self._rows[x]
+            if cached is None or cached[0] != row:
+                text = "".join("{} ".format(view[-1] if view else "X") for view in map(self._cell_view, row))
+                cached = (row, text)
+                self._rows[x] = cached
+            lines.append(cached[1] + "\n")
+        text = "".join(lines)
+        self._render = (key, text)
+        return text
 
-    def make_top(self):
+    def place(self, position, color):
         """
-        Make pawn the top of the stack
+        Places a single pawn of the given
+        color on an empty square
         """
-        self._top = True
+        bit = self.get_color_bit(color)
+        self._cells[position[0] * self._size + position[1]] = (bit << self._height_bits) | 1
 
-    def make_singleton(self):
+    def to_bytes(self):
         """
-        Make pawn a singleton by
-        unlinking the top and bottom
-        from other pawns
+        Returns the packed stacks as bytes
         """
-        self.make_bottom()
-        self.make_top()
+        return bytes(self._cells)
+
+    def load_bytes(self, data):
+        """
+        Sets the packed stacks from bytes
+        made by to_bytes
+        """
+        memoryview(self._cells).cast("B")[:] = data
 
 
 class Player:
@@ -82,7 +588,7 @@ class Player:
         """
         self._name = name
         self._color = color
-        self._reserve = []
+        self._reserve = 0
         self._num_captured = 0
 
     def get_name(self):
@@ -97,12 +603,19 @@ class Player:
         """
         return self._color
 
-    def captured_piece(self):
+    def captured_piece(self, num_pieces=1):
         """
         Increase the number of captured
-        pieces by one
+        pieces, by one unless told otherwise
         """
-        self._num_captured += 1
+        self._num_captured += num_pieces
+
+    def return_captured(self, num_pieces):
+        """
+        Decrease the number of captured pieces
+        when a capturing move is taken back
+        """
+        self._num_captured -= num_pieces
 
     def how_many_captured(self):
         """
@@ -110,26 +623,28 @@ class Player:
         """
         return self._num_captured
 
-    def add_to_reserve(self, pawn):
+    def add_to_reserve(self, num_pieces=1):
         """
-        adds a pawn to the players
-        reserve pieces list
+        adds pieces to the players reserve,
+        one unless told otherwise
         """
-        self._reserve.append(pawn)
+        self._reserve += num_pieces
 
     def remove_from_reserve(self):
         """
-        takes a pawn from the reserve
+        takes a piece from the reserve,
+        returns False if the reserve is empty
         """
-        if len(self._reserve) > 0:
-            return self._reserve.pop(0)
+        if self._reserve > 0:
+            self._reserve -= 1
+            return True
         else:
             return False
 
     def get_reserve(self):
         """
-        returns the reserve list
-        for the specified player
+        returns the number of pieces in
+        the reserve for the specified player
         """
         return self._reserve
 
@@ -140,196 +655,317 @@ class FocusGame:
     game Focus/Domination
     """
 
-    def __init__(self, p1, p2):
+    # optional instrumentation (see instrumentation.py), the
+    # hot paths only count and time moves when it is set
+    _stats = None
+
+    # callables told about every change of position with a Delta,
+    # None (the usual case) while a game has no listener
+    _listeners = None
+
+    def __init__(self, p1, p2, rules=None, undo_limit=None):
         # player info assignment as tuple
         # ex: ("PlayerA", "R") or ("PlayerB", "G")
+        # and the GameRules, the standard 6x6 game by default,
+        # undo_limit bounds the moves undo_move can take back
+        # (None for every move, 0 for a game never taken back),
+        # search players take back their moves so they need None
+        if rules is None:
+            rules = STANDARD_RULES
+        self._rules = rules
         self._p1 = Player(p1[0], p1[1])
         self._p2 = Player(p2[0], p2[1])
         self._players = [self._p1, self._p2]
-        self._whos_turn = None  # any player may start the game
-        self._turns_generator = None # initialize turns_generator
+        # players are indexed by side, 0 for p1 and 1 for p2
+        self._sides = {p1[0]: 0, p2[0]: 1}
+        self._turn = None  # side to move, any player may start the game
         self._game_over = False
-        # board initialization
-        self._board = [[None for y in range(6)] for x in range(6)]
-        for x in range(6):
-            for y in range(6):
-                if x % 2 == 0:
-                    if y < 2:
-                        self._board[x][y] = Pawn(p1[1])
-                        continue
-                    if y < 4:
-                        self._board[x][y] = Pawn(p2[1])
-                        continue
-                    if y < 6:
-                        self._board[x][y] = Pawn(p1[1])
-                        continue
-                else:
-                    if y < 2:
-                        self._board[x][y] = Pawn(p2[1])
-                        continue
-                    if y < 4:
-                        self._board[x][y] = Pawn(p1[1])
-                        continue
-                    if y < 6:
-                        self._board[x][y] = Pawn(p2[1])
-                        continue
+        # move deltas for undo_move, each entry is
+        # (side, start, start cell, end, end cell, pawns reserved,
+        #  pawns captured, turn, game over, hash, features),
+        # start is None for reserve moves, the oldest
+        # entries are dropped past the undo limit
+        if undo_limit is None:
+            self._undo_stack = []
+        elif undo_limit == 0:
+            self._undo_stack = NO_UNDO
+        else:
+            self._undo_stack = deque(maxlen=undo_limit)
+        self._hash = 0
+        self._features = 0
+        # action numbers of the moves made, with a to_bytes
+        # checkpoint every CHECKPOINT_INTERVAL moves starting
+        # with the position before the first move
+        self._move_log = array("H")
+        self._checkpoints = []
+        # move number of the position the log starts from,
+        # set by restore_bytes to sync with a game in progress
+        self._base_move = 0
+        # (hash, side, mask) of the last get_legal_mask
+        self._legal_mask = None
+        # board initialization, pairs of pawns alternating
+        # along each row with the rows alternating colors
+        self._board = Board((p1[1], p2[1]), rules)
+        colors = (p1[1], p2[1])
+        for x, y in rules.positions:
+            self._board.place((x, y), colors[(y // 2 + x) % 2])
+        self._hash = self.compute_hash()
+        self._features = self.compute_features()
+        self._checkpoints.append(self.to_bytes())
 
     def move_piece(self, player, start_pos, end_pos, num_pawns):
         """
         Function for making moves
         """
+        stats = self._stats
+        if stats is not None:
+            started = time.perf_counter()
 
-        # if starting pos has None return False
-        if self.getBoard()[start_pos[0]][start_pos[1]] is None:
-            return False
+        result = self._check_stack_move(self.get_player(player), start_pos, end_pos, num_pawns)
+        if result is not MoveResult.OK:
+            return self._rejected(result)
+
+        self.handle_move(player, start_pos, end_pos, num_pawns)
+        if stats is not None:
+            stats.observe("move_piece_seconds", time.perf_counter() - started)
+        if self._game_over is True:
+            return "{} Wins".format(player)
+        return "successfully moved"
+
+    def _rejected(self, result):
+        """
+        Counts a move rejected with the MoveResult
+        when instrumentation is on, returns False
+        """
+        if self._stats is not None:
+            self._stats.count("move_rejected", reason=result.value)
+        return False
+
+    def _check_stack_move(self, p, start_pos, end_pos, num_pawns):
+        """
+        Returns the MoveResult of the checks move_piece
+        makes on a stack move by the Player p (the color
+        is not checked when p is None), the start stack
+        is read once and nothing is changed
+        """
+        rules = self._rules
 
         # validate move coordinates legal(not out of range of board)
+        board_size = rules.get_board_size()
         for a in start_pos + end_pos:
-            if a < 0 or a > 5:
-                return False
+            if a < 0 or a >= board_size:
+                return MoveResult.OUT_OF_BOUNDS
+
+        # if starting pos is empty the move is not legal
+        cell = self.getBoard().get_cells()[start_pos[0] * board_size + start_pos[1]]
+        height = cell & rules.height_mask
+        if height == 0:
+            return MoveResult.EMPTY_START
 
         # validate player move request is horizontal or vertical
         if start_pos[0] != end_pos[0] and start_pos[1] != end_pos[1]:
-            return False
+            return MoveResult.NOT_ORTHOGONAL
 
         # validate move color is legal (top pawn color equal to player color)
-        # this should also work in the case that there is no pawn at the square
-        pawn = self.getBoard()[start_pos[0]][start_pos[1]]
-        while pawn.get_top() is not True:
-            pawn = pawn.get_top()
-        for p in self.getPlayers():
-            if p.get_name() == player:
-                if pawn.get_color() != p.get_color():
-                    return False
+        top_color = self.getBoard().get_colors()[(cell >> (rules.height_bits + height - 1)) & 1]
+        if p is not None and top_color != p.get_color():
+            return MoveResult.NOT_TOP_COLOR
 
         # validate the appropriate number of pieces are moving
-        if self.getPawnsAtCoordinate(start_pos) < num_pawns:
-            return False
-        if num_pawns > 5:
-            return False
+        if num_pawns < 1:
+            return MoveResult.NO_PAWNS
+        if height < num_pawns:
+            return MoveResult.TOO_MANY_PAWNS
+        if num_pawns > rules.get_stack_limit():
+            return MoveResult.OVER_STACK_LIMIT
 
         # validate that distance being moved is equal to the number of pawns
         row_difference = abs(start_pos[0] - end_pos[0])
         column_difference = abs(start_pos[1] - end_pos[1])
         if row_difference != num_pawns and column_difference != num_pawns:
-            return False
+            return MoveResult.WRONG_DISTANCE
+        return MoveResult.OK
+
+    def validate_move(self, player, move):
+        """
+        Returns MoveResult.OK if the player can make the
+        move, given as (start_pos, end_pos, num_pawns) or
+        (None, location, 1), otherwise the MoveResult saying
+        why not. Unlike move_piece it also checks the turn
+        and game over, and the game is not changed
+        """
+        side = self.get_side(player)
+        if side is None:
+            return MoveResult.UNKNOWN_PLAYER
+        if self._game_over:
+            return MoveResult.GAME_OVER
+        start_pos, end_pos, num_pawns = move
+        if start_pos is None:
+            # reserve placements are never the first move
+            if self._turn is None:
+                return MoveResult.RESERVE_FIRST_MOVE
+            if self._turn != side:
+                return MoveResult.WRONG_TURN
+            board_size = self._rules.get_board_size()
+            if not (0 <= end_pos[0] < board_size and 0 <= end_pos[1] < board_size):
+                return MoveResult.OUT_OF_BOUNDS
+            if self.getPawnsAtCoordinate(end_pos) != 0:
+                return MoveResult.RESERVE_OCCUPIED
+            if self._players[side].get_reserve() == 0:
+                return MoveResult.RESERVE_EMPTY
+            return MoveResult.OK
+        if self._turn is not None and self._turn != side:
+            return MoveResult.WRONG_TURN
+        return self._check_stack_move(self._players[side], start_pos, end_pos, num_pawns)
+
+    def get_legal_mask(self, player):
+        """
+        Returns the legal moves of the player as an int
+        with bit i set when action number i (see
+        GameRules.move_to_index) is legal. The mask of
+        the last position asked about is cached
+        """
+        side = self.get_side(player)
+        cached = self._legal_mask
+        if cached is not None and cached[0] == self._hash and cached[1] == side:
+            return cached[2]
+        mask = 0
+        if not (self._game_over or side is None or (self._turn is not None and self._turn != side)):
+            rules = self._rules
+            height_bits = rules.height_bits
+            height_mask = rules.height_mask
+            stack_actions = rules.stack_actions
+            cells = self.getBoard().get_cells()
+            squares = len(cells)
+
+            # stack moves from every square the player controls
+            for start, cell in enumerate(cells):
+                height = cell & height_mask
+                if height == 0 or (cell >> (height_bits + height - 1)) & 1 != side:
+                    continue
+                for num_pawns, end in rules.rays[start]:
+                    if num_pawns > height:
+                        break
+                    mask |= 1 << stack_actions[start * squares + end]
 
-        # handle first move
-        if self._whos_turn is None:
-            self._turns_generator = self.start_turns(player)
-            self.handle_move(player, start_pos, end_pos, num_pawns)
-            return "successfully moved"
-        # handle subsequent moves
-        else:
-            self.handle_move(player, start_pos, end_pos, num_pawns)
-            if self._game_over is True:
-                return "{} Wins".format(player)
-            return "successfully moved"
+            # reserve placements on empty squares (never the first move)
+            if self._turn is not None and self._players[side].get_reserve() > 0:
+                for location, cell in enumerate(cells):
+                    if cell == 0:
+                        mask |= 1 << (rules.reserve_actions + location)
+        self._legal_mask = (self._hash, side, mask)
+        return mask
+
+    def is_legal(self, player, move):
+        """
+        Returns True if the move is legal for the
+        player, checked against the legal mask
+        """
+        rules = self._rules
+        try:
+            index = rules.move_to_index(move)
+        except ValueError:
+            return False
+        if not 0 <= index < rules.num_actions or rules.index_to_move(index) != move:
+            return False
+        return (self.get_legal_mask(player) >> index) & 1 == 1
 
     def handle_move(self, player, start_pos, end_pos, num_pawns):
         """
         Move logic for move_piece function
         """
         # verify it is the correct players turn
-        if self.whos_turn_is_it() == player or self.whos_turn_is_it() is None:
-            # move
-            # get references to stacks/pawns at start and end location
-            bottom_pawn_at_start = self.getBoard()[start_pos[0]][start_pos[1]]
-            bottom_pawn_at_end = self.getBoard()[end_pos[0]][end_pos[1]]
-
-            # determine if you are moving entire stack or partial stack
-            # in the case that it is 1 pawn, this is also an entire stack
-            entire_stack = num_pawns == self.getPawnsAtCoordinate(start_pos) # this value is a boolean
-
-            # move stack pawn
-            if entire_stack:
-                # set starting board position to None
-                self.getBoard()[start_pos[0]][start_pos[1]] = None
-                # is there pawn at the end position or nothing
-                if bottom_pawn_at_end is None:
-                    self.getBoard()[end_pos[0]][end_pos[1]] = bottom_pawn_at_start
-                else:
-                    # get the pawn being captured
-                    captured = self.getPawnAtTop(end_pos)
-
-                    # change the top of the captured pawn
-                    captured.set_top(bottom_pawn_at_start)
-
-                    # reassign the bottom of the stac
-                    bottom_pawn_at_start.set_bottom(captured)
-
-            else:  # we are not moving the entire stack
-                # we must get reference to the pawn that will
-                # become the bottom of the stack we are moving
-                bottom_of_partial_stack = self.getPartialStackPawn(self.getPawnAtTop(start_pos), num_pawns)
-
-                # if space to be moving is empty just placce it
-                if self.getBoard()[end_pos[0]][end_pos[1]] is None:
-                    self.getBoard()[end_pos[0]][end_pos[1]] = bottom_of_partial_stack
-                    # reassign the top pawn remaining at the start position to top
-                    bottom_of_partial_stack.get_bottom().make_top()
-                    bottom_of_partial_stack.make_bottom()
-
-                else:
-                    # move partial stack onto captured
-                    captured = self.getPawnAtTop(end_pos)
-                    captured.set_top(bottom_of_partial_stack)
-
-                    # reassign the top pawn remaining at the start position to top
-                    bottom_of_partial_stack.get_bottom().make_top()
+        side = self.get_side(player)
+        if side is not None and (self._turn == side or self._turn is None):
+            rules = self._rules
+            height_bits = rules.height_bits
+            stack_keys = rules.stack_keys
+            cell_features = rules.cell_features
+            turn = self._turn
+            zobrist = self._hash
+            if turn is None:
+                # the first move decides who starts
+                self._turn = side
+                zobrist ^= rules.turn_keys[side]
 
-                    # reassign the bottom of the partial stack pawn
-                    bottom_of_partial_stack.set_bottom(captured)
+            # move
+            # get the packed stacks at the start and end location
+            cells = self.getBoard().get_cells()
+            board_size = rules.get_board_size()
+            start = start_pos[0] * board_size + start_pos[1]
+            end = end_pos[0] * board_size + end_pos[1]
+            start_cell = cells[start]
+            end_cell = cells[end]
+            start_height = start_cell & rules.height_mask
+            start_colors = start_cell >> height_bits
+            end_height = end_cell & rules.height_mask
+            end_colors = end_cell >> height_bits
+
+            # split the start stack, the top num_pawns pawns are moving
+            # in the case that every pawn moves the start becomes empty
+            remaining = start_height - num_pawns
+            moving = start_colors >> remaining
+            start_colors &= (1 << remaining) - 1
+            cells[start] = (start_colors << height_bits) | remaining
+
+            # place the moving pawns on top of the end stack
+            height = end_height + num_pawns
+            colors = end_colors | (moving << end_height)
+
+            # update the hash and features for the new start stack
+            zobrist ^= stack_keys[start][start_cell] ^ stack_keys[start][cells[start]]
+            features = (self._features - cell_features[start][start_cell] - cell_features[end][end_cell]
+                        + cell_features[start][cells[start]])
 
             # deal with any extra pieces and assign them accordingly
-            if self.getPawnsAtCoordinate(end_pos) > 5:
-
-                # get the bottom of the leftovers
-                left_overs_bottom = self.getBoard()[end_pos[0]][end_pos[1]]
-
-                # get bottom of the 5 stack we will leave
-                bottom_of_five_stack = self.getPartialStackPawn(self.getPawnAtTop(end_pos), 5)
-
-                # make the pawn beneath the bottom a top
-                bottom_of_five_stack.get_bottom().make_top()
-
-                # make the bottom of the five stack a bottom
-                bottom_of_five_stack.make_bottom()
-
-                # set new 5 stack on the board
-                self.getBoard()[end_pos[0]][end_pos[1]] = bottom_of_five_stack
-
-                # get player color and current player
-                color = "unknown"
-                current_player = None
-                for p in self.getPlayers():
-                    if p.get_name() == player:
-                        color = p.get_color()
-                        current_player = p
-
-                # cycle through left overs and assign reserve and capture accordingly
-                next_pawn = None
-
-                while True:
-
-                    # capture the next reference
-                    next_pawn = left_overs_bottom.get_top()
-
-                    # make current pawn a singleton(both top and bottom)
-                    left_overs_bottom.make_singleton()
-
-                    # check color and assign to reserve or capture
-                    if left_overs_bottom.get_color() == color:
-                        current_player.add_to_reserve(left_overs_bottom)
-                    else:
-                        current_player.captured_piece()
-
-                    # reassign the reference of left_overs_bottom
-                    left_overs_bottom = next_pawn
-
-                    if left_overs_bottom is True:
-                        
-                        break
+            reserved = 0
+            captured = 0
+            stack_limit = rules.get_stack_limit()
+            if height > stack_limit:
+
+                # the pawns beneath the top stack_limit are the left overs
+                left_overs = height - stack_limit
+                left_over_colors = colors & ((1 << left_overs) - 1)
+                colors >>= left_overs
+                height = stack_limit
+
+                # the side of the current player is also their color bit
+                current_player = self._players[side]
+                old_reserve = current_player.get_reserve()
+                old_captured = current_player.how_many_captured()
+
+                # count the left overs of each color at once,
+                # own color goes to reserve and the rest are captured
+                second_color = bin(left_over_colors).count("1")
+                if side == 0:
+                    reserved = left_overs - second_color
+                else:
+                    reserved = second_color
+                captured = left_overs - reserved
+                current_player.add_to_reserve(reserved)
+                current_player.captured_piece(captured)
+                if self._stats is not None:
+                    self._stats.count("overflows")
+                    self._stats.count("overflow_reserved", reserved)
+                    self._stats.count("overflow_captured", captured)
+                    self._stats.observe("overflow_pawns", left_overs)
+
+                # update the hash for the reserve and captures
+                reserve_keys = rules.reserve_keys[side]
+                captured_keys = rules.captured_keys[side]
+                zobrist ^= reserve_keys[old_reserve] ^ reserve_keys[old_reserve + reserved]
+                zobrist ^= captured_keys[old_captured] ^ captured_keys[old_captured + captured]
+
+            # set the new stack on the board
+            cells[end] = (colors << height_bits) | height
+            zobrist ^= stack_keys[end][end_cell] ^ stack_keys[end][cells[end]]
+            features += cell_features[end][cells[end]]
+
+            # record the delta so the move can be taken back
+            self._undo_stack.append((side, start, start_cell, end, end_cell, reserved,
+                                     captured, turn, self._game_over, self._hash, self._features))
+            self._hash = zobrist
+            self._features = features
 
             # check if there was a win
             if self.checkForWin(player) is True:
@@ -338,26 +974,78 @@ class FocusGame:
             # change turn at the end of the move
             self.changeTurn()
 
+            # log the move, the distance moved is the number of pawns
+            move_log = self._move_log
+            move_log.append(rules.stack_actions[start * len(cells) + end])
+            if len(move_log) % CHECKPOINT_INTERVAL == 0:
+                self._checkpoints.append(self.to_bytes())
+            if self._listeners is not None:
+                self._notify(self._make_delta(move_log[-1], start, end))
+
+            # pawns split off the start stack and the height they land on
+            if self._stats is not None:
+                self._stats.count("stack_moves")
+                self._stats.observe("stack_walk_pawns", num_pawns)
+                self._stats.observe("stack_height", height)
+        elif self._stats is not None:
+            self._stats.count("move_rejected", reason=MoveResult.WRONG_TURN.value)
+
+
+    def legal_moves(self, player):
+        """
+        Generator of the legal moves for the player,
+        stack moves are (start_pos, end_pos, num_pawns)
+        and reserve placements are (None, location, 1).
+        Nothing is yielded when it is not the players
+        turn or the game is over
+        """
+        # the side of the player is also their color bit
+        side = self.get_side(player)
+        if self._stats is not None:
+            self._stats.count("legal_moves_calls")
+        if self._game_over or side is None or (self._turn is not None and self._turn != side):
+            return
+
+        # stack moves from every square the player controls
+        rules = self._rules
+        height_bits = rules.height_bits
+        height_mask = rules.height_mask
+        positions = rules.positions
+        rays = rules.rays
+        cells = self.getBoard().get_cells()
+        for start, cell in enumerate(cells):
+            height = cell & height_mask
+            if height == 0 or (cell >> (height_bits + height - 1)) & 1 != side:
+                continue
+            start_pos = positions[start]
+            for num_pawns, end in rays[start]:
+                if num_pawns > height:
+                    break
+                yield (start_pos, positions[end], num_pawns)
+
+        # reserve placements on empty squares (never the first move)
+        if self._turn is not None and self._players[side].get_reserve() > 0:
+            for location, cell in enumerate(cells):
+                if cell == 0:
+                    yield (None, positions[location], 1)
 
     def printScore(self):
         """
         Prints the current score
         """
         for p in self.getPlayers():
-            reserve = []
-            for piece in p.get_reserve():
-                reserve.append(piece.get_color())
+            reserve = [p.get_color()] * p.get_reserve()
             print("{} | Captures: {} | Reserve: {}".format(p.get_name(), p.how_many_captured(), reserve))
 
     def checkForWin(self, player):
         """
         Function that checks for win
-        (ie did a player capture 6 pieces)
+        (ie did a player capture 6 pieces,
+        or the win captures of the rules)
         """
-        for p in self.getPlayers():
-            if p.get_name() == player:
-                if p.how_many_captured() >= 6:
-                    return True
+        p = self.get_player(player)
+        if p is not None and p.how_many_captured() >= self._rules.get_win_captures():
+            return True
 
     def show_pieces(self, position):
         """
@@ -365,32 +1053,26 @@ class FocusGame:
         the pieces that are present in that location
         starting with the bottom piece in the 0th index
         """
-        pieces = []
-        pawn = self._board[position[0]][position[1]]
-        if pawn is not None:
-            pieces.append(pawn.get_color())
-            while pawn.get_top() is not True:
-                pawn = pawn.get_top()
-                pieces.append(pawn.get_color())
-            return pieces
-        else:
+        view = self.getBoard().get_stack_view(position)
+        if len(view) == 0:
             return False
+        return list(view)
 
     def show_reserve(self, player):
         """
          function to show the reserve for any
         """
-        for p in self.getPlayers():
-            if p.get_name() == player:
-                return len(p.get_reserve())
+        p = self.get_player(player)
+        if p is not None:
+            return p.get_reserve()
 
     def show_captured(self, player):
         """
         returns the number of pieces capture by the player
         """
-        for p in self.getPlayers():
-            if p.get_name() == player:
-                return p.how_many_captured()
+        p = self.get_player(player)
+        if p is not None:
+            return p.how_many_captured()
 
     def reserved_move(self, player, location):
         """
@@ -400,46 +1082,447 @@ class FocusGame:
         """
 
         # Check that is is the appropriate turn
-        if self.whos_turn_is_it() == player:
-            for p in self.getPlayers():
+        side = self.get_side(player)
+        if side is not None and self._turn == side:
+            p = self._players[side]
+
+            # check that location is on the board
+            board_size = self._rules.get_board_size()
+            if not (0 <= location[0] < board_size and 0 <= location[1] < board_size):
+                return self._rejected(MoveResult.OUT_OF_BOUNDS)
+
+            # check that location is empty
+            if self.getPawnsAtCoordinate(location) != 0:
+                return self._rejected(MoveResult.RESERVE_OCCUPIED)
+
+            # check that reserve has a piece
+            if p.get_reserve() == 0:
+                return self._rejected(MoveResult.RESERVE_EMPTY)
+
+            # else place a piece
+            p.remove_from_reserve()
+            self.getBoard().place(location, p.get_color())
+            rules = self._rules
+            square = location[0] * board_size + location[1]
+            self._undo_stack.append((side, None, 0, square, 0, 0,
+                                     0, self._turn, self._game_over, self._hash, self._features))
+            reserve = p.get_reserve()
+            self._hash ^= rules.reserve_keys[side][reserve + 1] ^ rules.reserve_keys[side][reserve]
+            self._hash ^= rules.stack_keys[square][self.getBoard().get_cells()[square]]
+            self._features += rules.cell_features[square][self.getBoard().get_cells()[square]]
+            self.changeTurn()
+            self._move_log.append(rules.reserve_actions + square)
+            if len(self._move_log) % CHECKPOINT_INTERVAL == 0:
+                self._checkpoints.append(self.to_bytes())
+            if self._listeners is not None:
+                self._notify(self._make_delta(self._move_log[-1], None, square))
+            if self._stats is not None:
+                self._stats.count("reserve_placements")
+        elif self._stats is not None:
+            self._stats.count("move_rejected", reason=MoveResult.WRONG_TURN.value)
+
+    def apply_move(self, player, move):
+        """
+        Makes a move yielded by legal_moves for the
+        player, the move is not validated again.
+        The move can be taken back with undo_move
+        """
+        if move[0] is None:
+            self.reserved_move(player, move[1])
+        else:
+            self.handle_move(player, move[0], move[1], move[2])
 
-                if p.get_name() == player:
+    def undo_move(self):
+        """
+        Takes back the last move by restoring the
+        squares, reserve, captures and turn recorded
+        for it, returns False if there is no move
+        """
+        if len(self._undo_stack) == 0:
+            return False
+        (side, start, start_cell, end, end_cell, reserved,
+         captured, turn, game_over, zobrist, features) = self._undo_stack.pop()
+
+        # restore the squares the move touched
+        cells = self.getBoard().get_cells()
+        if start is not None:
+            cells[start] = start_cell
+        cells[end] = end_cell
+
+        # return the placed reserve pawn, or overflow pawns and captures
+        player = self._players[side]
+        if start is None:
+            player.add_to_reserve()
+        else:
+            if reserved > 0:
+                player.add_to_reserve(-reserved)
+            if captured > 0:
+                player.return_captured(captured)
 
-                    # check that location is None
-                    if self.getBoard()[location[0]][location[1]] is not None:
-                        return False
+        self._turn = turn
+        self._game_over = game_over
+        self._hash = zobrist
+        self._features = features
 
-                    # check that reserve has a piece
-                    if len(p.get_reserve()) == 0:
-                        return False
+        # drop the move from the log with a checkpoint made after it
+        self._move_log.pop()
+        if len(self._move_log) < (len(self._checkpoints) - 1) * CHECKPOINT_INTERVAL:
+            self._checkpoints.pop()
+        if self._listeners is not None:
+            self._notify(self._make_delta(None, start, end))
+        return True
 
-                    # else place a piece
-                    self.getBoard()[location[0]][location[1]] = p.get_reserve().pop()
-                    self.getBoard()[location[0]][location[1]].make_singleton()
-                    self.changeTurn()
+    def add_listener(self, listener):
+        """
+        Calls listener(game, delta) with a Delta after
+        every move, taken back move and applied delta
+        """
+        if self._listeners is None:
+            self._listeners = []
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """
+        Stops calling a listener added with add_listener
+        """
+        self._listeners.remove(listener)
+        if len(self._listeners) == 0:
+            self._listeners = None
+
+    def _notify(self, delta):
+        """
+        Calls every listener with the delta
+        """
+        for listener in tuple(self._listeners):
+            listener(self, delta)
+
+    def _make_delta(self, action, start, end):
+        """
+        Returns the Delta of the change that left the
+        start (None for a reserve move) and end squares
+        as they are now, action is None for an undo
+        """
+        cells = self.getBoard().get_cells()
+        if start is None:
+            squares = ((end, cells[end]),)
+        else:
+            squares = ((start, cells[start]), (end, cells[end]))
+        counters = (self._p1.get_reserve(), self._p2.get_reserve(),
+                    self._p1.how_many_captured(), self._p2.how_many_captured())
+        return Delta(self._base_move + len(self._move_log), action, squares, counters, self._turn, self._game_over)
+
+    def apply_delta(self, delta):
+        """
+        Makes the change of a Delta (or bytes made by
+        encode_delta) seen on another game at the same
+        position, with the same move number (a game
+        made from a snapshot takes the move number of
+        the snapshot, see restore_bytes). Moves go
+        onto the undo stack and move log (a taken back
+        move leaves them) so the two games stay alike.
+        Raises ValueError for a delta out of sequence
+        """
+        rules = self._rules
+        if not isinstance(delta, Delta):
+            delta = decode_delta(delta, rules)
+        move_count = self._base_move + len(self._move_log)
+        if delta.action is None and len(self._move_log) == 0:
+            raise ValueError("delta out of sequence")
+        if delta.move_number != (move_count + 1 if delta.action is not None else move_count - 1):
+            raise ValueError("delta out of sequence")
+
+        # set the squares, updating the hash and features
+        cells = self.getBoard().get_cells()
+        zobrist = self._hash
+        features = self._features
+        old_cells = {}
+        for square, cell in delta.squares:
+            old_cells[square] = cells[square]
+            zobrist ^= rules.stack_keys[square][cells[square]] ^ rules.stack_keys[square][cell]
+            features += rules.cell_features[square][cell] - rules.cell_features[square][cells[square]]
+            cells[square] = cell
+
+        # set the reserves and captures, keeping the
+        # changes for the undo record of a move
+        changes = []
+        for side, p in enumerate(self._players):
+            reserve = delta.counters[side]
+            captured = delta.counters[2 + side]
+            zobrist ^= rules.reserve_keys[side][p.get_reserve()] ^ rules.reserve_keys[side][reserve]
+            zobrist ^= rules.captured_keys[side][p.how_many_captured()] ^ rules.captured_keys[side][captured]
+            changes.append((reserve - p.get_reserve(), captured - p.how_many_captured()))
+            p.add_to_reserve(reserve - p.get_reserve())
+            p.captured_piece(captured - p.how_many_captured())
+
+        if self._turn is not None:
+            zobrist ^= rules.turn_keys[self._turn]
+        if delta.turn is not None:
+            zobrist ^= rules.turn_keys[delta.turn]
+
+        if delta.action is None:
+            # a taken back move
+            if len(self._undo_stack) > 0:
+                self._undo_stack.pop()
+            self._move_log.pop()
+            if len(self._move_log) < (len(self._checkpoints) - 1) * CHECKPOINT_INTERVAL:
+                self._checkpoints.pop()
+        else:
+            # the mover is the side not to move after it
+            start_pos, end_pos, num_pawns = rules.index_to_move(delta.action)
+            board_size = rules.get_board_size()
+            end = end_pos[0] * board_size + end_pos[1]
+            side = delta.turn ^ 1
+            if start_pos is None:
+                start = None
+                reserved, captured = 0, 0
+            else:
+                start = start_pos[0] * board_size + start_pos[1]
+                reserved, captured = changes[side]
+            self._undo_stack.append((side, start, old_cells.get(start, 0), end, old_cells.get(end, 0), reserved,
+                                     captured, self._turn, self._game_over, self._hash, self._features))
+            self._move_log.append(delta.action)
+
+        self._turn = delta.turn
+        self._game_over = delta.game_over
+        self._hash = zobrist
+        self._features = features
+        if delta.action is not None and len(self._move_log) % CHECKPOINT_INTERVAL == 0:
+            self._checkpoints.append(self.to_bytes())
+        if self._listeners is not None:
+            self._notify(delta)
+
+    def get_move_count(self):
+        """
+        Returns the number of moves in the move log
+        """
+        return len(self._move_log)
+
+    def get_move_number(self):
+        """
+        Returns the number of moves made in the game,
+        the move number of the position the log starts
+        from plus the moves in the log
+        """
+        return self._base_move + len(self._move_log)
+
+    def get_move_log(self):
+        """
+        Returns the moves made as a list of
+        (start_pos, end_pos, num_pawns) and
+        (None, location, 1) tuples
+        """
+        return [self._rules.index_to_move(action) for action in self._move_log]
+
+    def position_at(self, move_number):
+        """
+        Returns a new game at the position after the
+        move number of the move log (0 for the position
+        the log starts from), made by restoring the nearest
+        checkpoint and replaying only the moves after it.
+        The new game keeps the log up to the move number
+        """
+        if move_number < 0 or move_number > len(self._move_log):
+            raise IndexError("move number out of range")
+        checkpoint = min(move_number // CHECKPOINT_INTERVAL, len(self._checkpoints) - 1)
+        players = [(p.get_name(), p.get_color()) for p in self._players]
+        game = FocusGame.from_bytes(self._checkpoints[checkpoint], players[0], players[1], self._rules)
+        replayed = self._move_log[checkpoint * CHECKPOINT_INTERVAL:move_number]
+        game._replay(replayed)
+        game._move_log = self._move_log[:move_number]
+        game._base_move = self._base_move
+        game._checkpoints = self._checkpoints[:move_number // CHECKPOINT_INTERVAL + 1]
+        return game
+
+    def log_to_bytes(self):
+        """
+        Returns the move log as bytes: the to_bytes record
+        of the position the log starts from followed by the
+        action numbers as little endian 16 bit integers
+        """
+        move_log = array("H", self._move_log)
+        if sys.byteorder == "big":
+            move_log.byteswap()
+        return self._checkpoints[0] + move_log.tobytes()
+
+    @classmethod
+    def from_log(cls, data, p1, p2, rules=None):
+        """
+        Returns a new game for the players and rules
+        (given as in __init__) that replayed a move
+        log made by log_to_bytes
+        """
+        game = cls(p1, p2, rules)
+        record_size = game.get_rules().record_size
+        game.restore_bytes(data[:record_size])
+        move_log = array("H", bytes(data[record_size:]))
+        if sys.byteorder == "big":
+            move_log.byteswap()
+        game._replay(move_log)
+        return game
+
+    def _replay(self, actions):
+        """
+        Makes the moves of a list of action numbers, the
+        first mover (before any turn) is the player whose
+        pawn tops the start stack of the first move
+        """
+        rules = self._rules
+        for action in actions:
+            move = rules.index_to_move(action)
+            side = self._turn
+            if side is None:
+                side = self.getBoard().get_color_bit(self.getBoard().get_top_color(move[0]))
+            self.apply_move(self._players[side].get_name(), move)
+
+    def to_bytes(self):
+        """
+        Returns the position as a record of the
+        record size of the rules (42 bytes
+        in the standard game): the packed stacks, the
+        reserve and captures of p1 and p2, the side to
+        move and the game over flag
+        """
+        turn = NO_TURN if self._turn is None else self._turn
+        return self.getBoard().to_bytes() + bytes((
+            self._p1.get_reserve(), self._p2.get_reserve(),
+            self._p1.how_many_captured(), self._p2.how_many_captured(),
+            turn, int(self._game_over)))
+
+    @classmethod
+    def from_bytes(cls, data, p1, p2, rules=None, move_number=0):
+        """
+        Returns a new game for the players and rules
+        (given as in __init__) at the position of a
+        record made by to_bytes, move_number as in
+        restore_bytes
+        """
+        game = cls(p1, p2, rules)
+        game.restore_bytes(data, move_number)
+        return game
+
+    def restore_bytes(self, data, move_number=0):
+        """
+        Sets the game to the position of a record made
+        by to_bytes, the undo stack is cleared and the
+        move log starts again from the position. The
+        move_number is the get_move_number of the game
+        the record was made from, so a mirror made from
+        a snapshot mid game accepts the deltas after it
+        """
+        record_size = self._rules.record_size
+        self.getBoard().load_bytes(data[:record_size - 6])
+        reserve_1, reserve_2, captured_1, captured_2, turn, game_over = data[record_size - 6:record_size]
+        for p, reserve, captured in ((self._p1, reserve_1, captured_1), (self._p2, reserve_2, captured_2)):
+            p.add_to_reserve(reserve - p.get_reserve())
+            p.captured_piece(captured - p.how_many_captured())
+        self._turn = None if turn == NO_TURN else turn
+        self._game_over = bool(game_over)
+        self._undo_stack.clear()
+        self._hash = self.compute_hash()
+        self._features = self.compute_features()
+        self._move_log = array("H")
+        self._base_move = move_number
+        self._checkpoints = [self.to_bytes()]
+
+    def get_hash(self):
+        """
+        Returns the 64 bit Zobrist hash of the
+        position, kept up to date by every move
+        """
+        return self._hash
+
+    def compute_hash(self):
+        """
+        Computes the Zobrist hash of the position
+        from scratch (stacks, reserves, captures
+        and the player to move)
+        """
+        rules = self._rules
+        zobrist = 0
+        for square, cell in enumerate(self.getBoard().get_cells()):
+            zobrist ^= rules.stack_keys[square][cell]
+        for side, p in enumerate(self.getPlayers()):
+            zobrist ^= rules.reserve_keys[side][p.get_reserve()]
+            zobrist ^= rules.captured_keys[side][p.how_many_captured()]
+        if self._turn is not None:
+            zobrist ^= rules.turn_keys[self._turn]
+        return zobrist
+
+    def get_features(self):
+        """
+        Returns the Features of the position (controlled
+        squares, pawns on the board, tall stacks and stack
+        moves), each a (p1, p2) tuple of counts, kept up
+        to date by every move rather than counted here
+        """
+        counts = [(self._features >> (FEATURE_BITS * field)) & FEATURE_MASK
+                  for field in range(2 * len(FEATURE_NAMES))]
+        return Features(*zip(counts[:len(FEATURE_NAMES)], counts[len(FEATURE_NAMES):]))
+
+    def compute_features(self):
+        """
+        Computes the packed feature counts of
+        the position from scratch
+        """
+        cell_features = self._rules.cell_features
+        features = 0
+        for square, cell in enumerate(self.getBoard().get_cells()):
+            features += cell_features[square][cell]
+        return features
 
     def changeTurn(self):
         """
         Changes the player turn
         """
-        self._whos_turn = next(self._turns_generator)
-        return self._whos_turn
+        self._turn ^= 1
+        self._hash ^= self._rules.turn_keys[0] ^ self._rules.turn_keys[1]
+        return self.whos_turn_is_it()
+
+    def is_game_over(self):
+        """
+        Returns True once a player has
+        captured 6 pieces (the win captures
+        of the rules)
+        """
+        return self._game_over
 
     def whos_turn_is_it(self):
         """
         Returns the turn of the current player
         """
-        return self._whos_turn
+        if self._turn is None:
+            return None
+        return self._players[self._turn].get_name()
+
+    def get_turn(self):
+        """
+        Returns the side (0 for p1, 1 for p2) of the
+        player to move, None before the first move
+        """
+        return self._turn
+
+    def get_side(self, player):
+        """
+        Returns the side (0 for p1, 1 for p2) of the
+        player name, None if there is no such player
+        """
+        return self._sides.get(player)
+
+    def get_player(self, player):
+        """
+        Returns the Player with the name,
+        None if there is no such player
+        """
+        side = self._sides.get(player)
+        if side is None:
+            return None
+        return self._players[side]
 
-    def start_turns(self, player):
+    def get_rules(self):
         """
-        initializes generator for turns
+        Returns the GameRules of the game
         """
-        turn = player
-        while True:
-            for p in [p for p in self.getPlayers() if p.get_name() != turn]:
-                turn = p.get_name()
-            yield turn
+        return self._rules
 
     def getPlayers(self):
         """
@@ -459,52 +1542,21 @@ class FocusGame:
         and returns the number of pawns
         in the stack
         """
-        count = 0
-        if self.getBoard()[coordinate[0]][coordinate[1]] is None:
-            return count
-        else:
-            count += 1
-            pawn = self.getBoard()[coordinate[0]][coordinate[1]]
-            while pawn.get_top() is not True:
-                pawn = pawn.get_top()
-                count += 1
-            return count
-
-    def getPawnAtTop(self, coordinate):
-        """
-        Returns the pawn at the stop of a stack
-        """
-
-        pawn = self.getBoard()[coordinate[0]][coordinate[1]]
-        while pawn.get_top() is not True:
-            pawn = pawn.get_top()
-        return pawn
+        return self.getBoard().get_height(coordinate)
 
-    def getPartialStackPawn(self, top_pawn, num_pawns):
+    def print_board(self):
         """
-        Get reference to the pawn that
-        defines the partial stack
+        Prints the board
         """
-        pawn = top_pawn
-        for x in range(1, num_pawns):
-            pawn = pawn.get_bottom()
-        return pawn
+        print(self.render_board(), end="")
 
-    def print_board(self):
+    def render_board(self):
         """
-        Prints the board
+        Returns the board as print_board prints it,
+        made once per position however often it is
+        asked for (see Board.render)
         """
-        for x in range(6):
-            for y in range(6):
-                # check if we are looking at the top
-                pawn = self._board[x][y]
-                if pawn is None:
-                    print("X", end=" ")
-                else:
-                    while pawn.get_top() is not True:
-                        pawn = pawn.get_top()
-                    print(pawn.get_color(), end=" ")
-            print("")
+        return self._board.render()
 
 
 def main():
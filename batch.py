@@ -0,0 +1,225 @@
+# NumPy batch of FocusGame boards played in lockstep
+
+# Required Moduels
+import numpy as np
+
+from FocusGame import (BOARD_SIZE, STACK_LIMIT, WIN_CAPTURES, HEIGHT_BITS, HEIGHT_MASK, POSITIONS,
+                       DIRECTIONS, RESERVE_ACTIONS, NUM_ACTIONS)
+
+NUM_SQUARES = BOARD_SIZE * BOARD_SIZE
+
+
+def build_action_tables():
+    """
+    Returns the start square, end square (-1 when off
+    the board) and number of pawns of every stack move
+    """
+    starts = np.zeros(RESERVE_ACTIONS, dtype=np.intp)
+    ends = np.full(RESERVE_ACTIONS, -1, dtype=np.intp)
+    counts = np.zeros(RESERVE_ACTIONS, dtype=np.int32)
+    index = 0
+    for start, (x, y) in enumerate(POSITIONS):
+        for dx, dy in DIRECTIONS:
+            for num_pawns in range(1, STACK_LIMIT + 1):
+                end_x = x + dx * num_pawns
+                end_y = y + dy * num_pawns
+                starts[index] = start
+                counts[index] = num_pawns
+                if 0 <= end_x < BOARD_SIZE and 0 <= end_y < BOARD_SIZE:
+                    ends[index] = end_x * BOARD_SIZE + end_y
+                index += 1
+    return starts, ends, counts
+
+
+ACTION_STARTS, ACTION_ENDS, ACTION_COUNTS = build_action_tables()
+ACTION_ON_BOARD = ACTION_ENDS >= 0
+POPCOUNT = np.array([bin(i).count("1") for i in range(1 << (2 * STACK_LIMIT))], dtype=np.int32)
+
+
+class BatchFocusGame:
+    """
+    Represents K games of Focus/Domination stored as
+    NumPy arrays and stepped together. Stacks use the
+    same packed layout as Board (3 height bits, then the
+    color bits from the bottom up, 0 for the first
+    player's color), so the K x 6 x 6 x 5 color planes
+    and the heights are views computed from one array
+    """
+
+    def __init__(self, num_games, first=0):
+        """
+        Creates num_games games at the starting
+        layout, first is the index (0 or 1) of the
+        player making the first move in each game
+        """
+        layout = np.zeros(NUM_SQUARES, dtype=np.uint8)
+        for square, (x, y) in enumerate(POSITIONS):
+            side = 0 if (y // 2) % 2 == 0 else 1
+            layout[square] = ((side ^ (x % 2)) << HEIGHT_BITS) | 1
+        self._cells = np.tile(layout, (num_games, 1))
+        self._reserves = np.zeros((num_games, 2), dtype=np.int32)
+        self._captures = np.zeros((num_games, 2), dtype=np.int32)
+        self._turn = np.zeros(num_games, dtype=np.int32) + first
+        self._moves = np.zeros(num_games, dtype=np.int32)
+        self._done = np.zeros(num_games, dtype=bool)
+        self._winner = np.full(num_games, -1, dtype=np.int32)
+
+    def get_cells(self):
+        """
+        Returns the K x 36 packed stacks
+        """
+        return self._cells
+
+    def get_heights(self):
+        """
+        Returns the K x 6 x 6 stack heights
+        """
+        return (self._cells & HEIGHT_MASK).reshape(-1, BOARD_SIZE, BOARD_SIZE)
+
+    def get_color_planes(self):
+        """
+        Returns K x 6 x 6 x 5 planes holding 1 or 2 for
+        a pawn of the first or second player's color at
+        each height from the bottom, and 0 above the stack
+        """
+        levels = np.arange(STACK_LIMIT, dtype=np.uint8)
+        cells = self._cells[..., None]
+        colors = (cells >> (HEIGHT_BITS + levels)) & 1
+        present = levels < (cells & HEIGHT_MASK)
+        planes = np.where(present, colors + 1, 0).astype(np.uint8)
+        return planes.reshape(-1, BOARD_SIZE, BOARD_SIZE, STACK_LIMIT)
+
+    def get_reserves(self):
+        """
+        Returns the K x 2 reserve counts
+        """
+        return self._reserves
+
+    def get_captures(self):
+        """
+        Returns the K x 2 capture counts
+        """
+        return self._captures
+
+    def get_turn(self):
+        """
+        Returns the index of the player to move in each game
+        """
+        return self._turn
+
+    def get_done(self):
+        """
+        Returns which games are over
+        """
+        return self._done
+
+    def get_winner(self):
+        """
+        Returns the index of the winner of each
+        game, -1 while the game is not won
+        """
+        return self._winner
+
+    def get_move_counts(self):
+        """
+        Returns the number of moves made in each game
+        """
+        return self._moves
+
+    def legal_mask(self):
+        """
+        Returns a K x 756 boolean mask of the legal
+        actions (see move_to_index) in every game,
+        the mask is empty for games that are over
+        """
+        heights = (self._cells & HEIGHT_MASK).astype(np.int32)
+        tops = (self._cells.astype(np.int32) >> (HEIGHT_BITS + np.maximum(heights - 1, 0))) & 1
+        # how far the player can move from each square (0 if not controlled)
+        reach = np.where(tops == self._turn[:, None], heights, 0)
+
+        mask = np.zeros((len(self._cells), NUM_ACTIONS), dtype=bool)
+        mask[:, :RESERVE_ACTIONS] = (reach[:, ACTION_STARTS] >= ACTION_COUNTS) & ACTION_ON_BOARD
+        games = np.arange(len(self._cells))
+        has_reserve = self._reserves[games, self._turn] > 0
+        mask[:, RESERVE_ACTIONS:] = (heights == 0) & has_reserve[:, None]
+        mask[self._done] = False
+        return mask
+
+    def step(self, actions):
+        """
+        Makes one action per game (ignored for games
+        that are over), the actions must be legal.
+        Stacks over 5 pawns lose their bottom pawns,
+        the mover's own color goes to the reserve and
+        the rest are captured as in FocusGame.handle_move
+        """
+        actions = np.asarray(actions, dtype=np.intp)
+        active = ~self._done
+        games = np.nonzero(active & (actions < RESERVE_ACTIONS))[0]
+        placements = np.nonzero(active & (actions >= RESERVE_ACTIONS))[0]
+        turn = self._turn
+
+        # stack moves
+        if len(games) > 0:
+            action = actions[games]
+            side = turn[games]
+            start = ACTION_STARTS[action]
+            end = ACTION_ENDS[action]
+            num_pawns = ACTION_COUNTS[action]
+            start_cell = self._cells[games, start].astype(np.int32)
+            end_cell = self._cells[games, end].astype(np.int32)
+
+            # split the start stack
+            remaining = (start_cell & HEIGHT_MASK) - num_pawns
+            start_colors = start_cell >> HEIGHT_BITS
+            moving = start_colors >> remaining
+            start_colors &= (1 << remaining) - 1
+            self._cells[games, start] = (start_colors << HEIGHT_BITS) | remaining
+
+            # stack the moving pawns on the end stack
+            end_height = end_cell & HEIGHT_MASK
+            height = end_height + num_pawns
+            colors = (end_cell >> HEIGHT_BITS) | (moving << end_height)
+
+            # resolve the pawns beneath the top 5
+            left_overs = np.maximum(height - STACK_LIMIT, 0)
+            ones = POPCOUNT[colors & ((1 << left_overs) - 1)]
+            own = np.where(side == 1, ones, left_overs - ones)
+            self._reserves[games, side] += own
+            self._captures[games, side] += left_overs - own
+            colors >>= left_overs
+            height -= left_overs
+            self._cells[games, end] = (colors << HEIGHT_BITS) | height
+
+        # reserve placements
+        if len(placements) > 0:
+            side = turn[placements]
+            squares = actions[placements] - RESERVE_ACTIONS
+            self._cells[placements, squares] = (side << HEIGHT_BITS) | 1
+            self._reserves[placements, side] -= 1
+
+        # check for wins and change turns
+        won = active & (self._captures[np.arange(len(turn)), turn] >= WIN_CAPTURES)
+        self._winner[won] = turn[won]
+        self._done |= won
+        self._moves[active] += 1
+        self._turn[active & ~won] ^= 1
+
+    def step_random(self, rng):
+        """
+        Makes a uniformly random legal action in every
+        game, games where the player to move has no
+        legal action are lost by that player. Returns
+        the actions made (-1 for games that are over)
+        """
+        mask = self.legal_mask()
+        stuck = ~self._done & ~mask.any(axis=1)
+        self._winner[stuck] = self._turn[stuck] ^ 1
+        self._done |= stuck
+
+        scores = rng.random(mask.shape, dtype=np.float32)
+        scores *= mask
+        actions = scores.argmax(axis=1)
+        actions[self._done] = -1
+        self.step(actions)
+        return actions
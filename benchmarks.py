@@ -0,0 +1,249 @@
+# Benchmarks for the FocusGame hot paths
+#
+# to run and save a baseline:
+# python3 benchmarks.py --out baseline.json
+# to compare a later run against it (exits with 1 on a regression):
+# python3 benchmarks.py --baseline baseline.json --tolerance 0.15
+
+# Required Moduels
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from FocusGame import FocusGame, STANDARD_RULES, NO_TURN
+from simulate import PLAYERS
+
+# metrics where a larger value is better, lower is better for the rest
+HIGHER_IS_BETTER = {"games_per_sec", "moves_per_sec"}
+
+
+def sample_positions(count, seed, max_plies=60):
+    """
+    Returns games at count positions reached by
+    random play from the seed, each with a legal
+    stack move for the player to move
+    """
+    rng = random.Random(seed)
+    samples = []
+    while len(samples) < count:
+        game = FocusGame(*PLAYERS)
+        side = rng.randrange(2)
+        for ply in range(rng.randrange(max_plies)):
+            moves = list(game.legal_moves(PLAYERS[side][0]))
+            if len(moves) == 0:
+                break
+            game.apply_move(PLAYERS[side][0], moves[rng.randrange(len(moves))])
+            if game.is_game_over():
+                break
+            side = 1 - side
+        name = PLAYERS[side][0]
+        moves = [move for move in game.legal_moves(name) if move[0] is not None]
+        if len(moves) > 0:
+            samples.append((game, name, moves[rng.randrange(len(moves))]))
+    return samples
+
+
+def time_per_call(function, calls, repeat):
+    """
+    Returns the best time of repeat runs of
+    function(calls) divided by calls, in ns
+    """
+    best = None
+    for run in range(repeat):
+        start = time.perf_counter_ns()
+        function(calls)
+        elapsed = time.perf_counter_ns() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / calls
+
+
+def bench_moves(seed, repeat):
+    """
+    Returns the ns per move_piece call (taken back
+    with undo_move), per undo_move alone and per full
+    legal_moves generation over sampled positions
+    """
+    samples = sample_positions(200, seed)
+
+    def move_and_undo(calls):
+        for index in range(calls):
+            game, name, move = samples[index % len(samples)]
+            game.move_piece(name, move[0], move[1], move[2])
+            game.undo_move()
+
+    def apply_and_undo(calls):
+        for index in range(calls):
+            game, name, move = samples[index % len(samples)]
+            game.apply_move(name, move)
+            game.undo_move()
+
+    def generate(calls):
+        for index in range(calls):
+            game, name, move = samples[index % len(samples)]
+            for move in game.legal_moves(name):
+                pass
+
+    return {
+        "move_piece_undo_ns": time_per_call(move_and_undo, 20000, repeat),
+        "apply_move_undo_ns": time_per_call(apply_and_undo, 20000, repeat),
+        "legal_moves_ns": time_per_call(generate, 2000, repeat),
+    }
+
+
+def bench_stack_queries(repeat):
+    """
+    Returns the ns per getPawnsAtCoordinate and
+    show_pieces call for every stack height
+    """
+    results = {}
+    game = FocusGame(*PLAYERS)
+    squares = STANDARD_RULES.record_size - 6
+    for height in range(1, STANDARD_RULES.get_stack_limit() + 1):
+        # alternating colors, so every stack has both
+        colors = int("10" * height, 2) & ((1 << height) - 1)
+        cell = (colors << STANDARD_RULES.height_bits) | height
+        game.restore_bytes(bytes([cell] * squares) + bytes((0, 0, 0, 0, NO_TURN, 0)))
+        positions = STANDARD_RULES.positions
+
+        def count_pawns(calls):
+            for index in range(calls):
+                game.getPawnsAtCoordinate(positions[index % squares])
+
+        def show(calls):
+            for index in range(calls):
+                game.show_pieces(positions[index % squares])
+
+        results["pawns_at_h{}_ns".format(height)] = time_per_call(count_pawns, 50000, repeat)
+        results["show_pieces_h{}_ns".format(height)] = time_per_call(show, 50000, repeat)
+    return results
+
+
+def bench_games(seed, games):
+    """
+    Returns the games and moves per second
+    of random games played from the seed
+    """
+    rng = random.Random(seed)
+    moves_made = 0
+    start = time.perf_counter()
+    for game_index in range(games):
+        game = FocusGame(*PLAYERS)
+        side = game_index % 2
+        for ply in range(400):
+            moves = list(game.legal_moves(PLAYERS[side][0]))
+            if len(moves) == 0:
+                break
+            game.apply_move(PLAYERS[side][0], moves[rng.randrange(len(moves))])
+            moves_made += 1
+            if game.is_game_over():
+                break
+            side = 1 - side
+    elapsed = time.perf_counter() - start
+    return {"games_per_sec": games / elapsed, "moves_per_sec": moves_made / elapsed}
+
+
+def bench_memory(seed, count=1000, plies=40):
+    """
+    Returns the bytes allocated per live FocusGame,
+    new and after plies random moves (move log and
+    undo records included)
+    """
+    rng = random.Random(seed)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        games = [FocusGame(*PLAYERS) for index in range(count)]
+        new = (tracemalloc.get_traced_memory()[0] - start) / count
+        for game in games:
+            side = 0
+            for ply in range(plies):
+                moves = list(game.legal_moves(PLAYERS[side][0]))
+                if len(moves) == 0 or game.is_game_over():
+                    break
+                game.apply_move(PLAYERS[side][0], moves[rng.randrange(len(moves))])
+                side = 1 - side
+        played = (tracemalloc.get_traced_memory()[0] - start) / count
+    finally:
+        tracemalloc.stop()
+    return {"bytes_per_game": new, "bytes_per_game_played": played}
+
+
+def run_benchmarks(seed=0, repeat=5, games=200):
+    """
+    Runs every benchmark with fixed seeds and
+    returns a dict of the environment and metrics
+    """
+    metrics = {}
+    metrics.update(bench_moves(seed, repeat))
+    metrics.update(bench_stack_queries(repeat))
+    metrics.update(bench_games(seed, games))
+    metrics.update(bench_memory(seed))
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "seed": seed,
+        "metrics": metrics,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns a list of (metric, baseline, current, change)
+    for every metric of both runs, change is positive
+    when the current run is worse, and the list of
+    metrics worse than the tolerance (0.1 is 10%)
+    """
+    rows = []
+    regressions = []
+    for name, current in sorted(results["metrics"].items()):
+        old = baseline["metrics"].get(name)
+        if not old:
+            continue
+        if name in HIGHER_IS_BETTER:
+            change = old / current - 1 if current else float("inf")
+        else:
+            change = current / old - 1
+        rows.append((name, old, current, change))
+        if change > tolerance:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the FocusGame hot paths")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs, the best is kept")
+    parser.add_argument("--games", type=int, default=200, help="random games for throughput")
+    parser.add_argument("--out", default=None, help="write the results as JSON")
+    parser.add_argument("--baseline", default=None, help="results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed slowdown, 0.1 is 10%%")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.seed, args.repeat, args.games)
+    if args.out is not None:
+        with open(args.out, "w") as out:
+            json.dump(results, out, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+    if args.baseline is not None:
+        with open(args.baseline) as baseline:
+            rows, regressions = compare(results, json.load(baseline), args.tolerance)
+        for name, old, current, change in rows:
+            flag = " REGRESSION" if name in regressions else ""
+            print("{:<28} {:>14.1f} {:>14.1f} {:>+8.1%}{}".format(name, old, current, change, flag),
+                  file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
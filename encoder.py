@@ -0,0 +1,300 @@
+# NumPy feature planes for FocusGame positions and
+# sharded training data files streamed from self-play
+#
+# to write 1000 games of samples into shards:
+# python3 encoder.py data/ --games 1000 --p1 search:0.01 --p2 mcts:200
+
+# Required Moduels
+import argparse
+import json
+import os
+import random
+
+import numpy as np
+
+from FocusGame import FocusGame, STANDARD_RULES, NO_TURN, MAX_TABLE_BITS
+from simulate import PLAYERS, MAX_GAME_MOVES, make_policy
+
+MANIFEST = "manifest.json"
+
+
+def build_cell_planes(rules, cells=None):
+    """
+    Returns the stack planes of the packed stack values
+    (every value when cells is None), the row of a value
+    holds 2 * stack_limit values, 1 where the stack has a
+    pawn of the color (the first player's color first) at
+    the level from the bottom
+    """
+    limit = rules.get_stack_limit()
+    if cells is None:
+        cells = np.arange(1 << (rules.height_bits + limit))
+    heights = cells & rules.height_mask
+    levels = np.arange(limit)
+    shifts = (rules.height_bits + levels).astype(cells.dtype)
+    colors = (cells[:, None] >> shifts) & 1
+    present = (levels < heights[:, None]) & (heights[:, None] <= limit)
+    planes = np.zeros((len(cells), 2 * limit), dtype=np.uint8)
+    planes[:, :limit] = present & (colors == 0)
+    planes[:, limit:] = present & (colors == 1)
+    return planes
+
+
+class PositionEncoder:
+    """
+    Represents an encoder of positions into planes of
+    board size x board size: one plane per color and
+    stack level (stack_limit levels of the first player's
+    color, then of the second's), then the reserves and
+    captures of p1 and p2 as constant planes, then the
+    side to move (1 when it is p2)
+    """
+
+    def __init__(self, rules=STANDARD_RULES, dtype=np.float32):
+        """
+        Creates the encoder for positions under the rules
+        """
+        self._rules = rules
+        self._size = rules.get_board_size()
+        self._squares = self._size * self._size
+        self._stack_planes = 2 * rules.get_stack_limit()
+        # planes by cell value, transposed so a take over the
+        # cells of a board fills every stack plane at once,
+        # wider stacks get their planes built per record
+        self._cell_planes = None
+        if rules.height_bits + rules.get_stack_limit() <= MAX_TABLE_BITS:
+            self._cell_planes = np.ascontiguousarray(build_cell_planes(rules).T, dtype=dtype)
+        self._cell_dtype = np.dtype(rules.typecode)
+        self._scratch = np.empty((self._stack_planes, self._squares), dtype=dtype)
+        self._extra = np.empty(5, dtype=dtype)
+        self.dtype = np.dtype(dtype)
+        self.shape = (self._stack_planes + 5, self._size, self._size)
+
+    def new_buffer(self, count=None):
+        """
+        Returns an uninitialized buffer for one
+        position, or for count positions
+        """
+        if count is None:
+            return np.empty(self.shape, dtype=self.dtype)
+        return np.empty((count,) + self.shape, dtype=self.dtype)
+
+    def encode_record(self, record, out=None, side=None):
+        """
+        Encodes a to_bytes record into out (a new buffer
+        if none) and returns it, side is the player to move
+        when the record has none (before the first move)
+        """
+        if out is None:
+            out = self.new_buffer()
+        counters = self._rules.record_size - 6
+        cells = np.frombuffer(record, dtype=self._cell_dtype, count=self._squares)
+        if self._cell_planes is None:
+            self._scratch[:] = build_cell_planes(self._rules, cells).T
+        else:
+            np.take(self._cell_planes, cells, axis=1, out=self._scratch)
+        out[:self._stack_planes] = self._scratch.reshape(self._stack_planes, self._size, self._size)
+        extra = self._extra
+        extra[:] = np.frombuffer(record, dtype=np.uint8, count=5, offset=counters)
+        if extra[4] == NO_TURN:
+            extra[4] = side or 0
+        out[self._stack_planes:] = extra[:, None, None]
+        return out
+
+    def encode(self, game, out=None, side=None):
+        """
+        Encodes a FocusGame position into out (a
+        new buffer if none) and returns it
+        """
+        return self.encode_record(game.to_bytes(), out, side)
+
+    def encode_batch(self, positions, out=None):
+        """
+        Encodes a list of games or records into
+        out (a new buffer if none) and returns it
+        """
+        if out is None:
+            out = self.new_buffer(len(positions))
+        for index, position in enumerate(positions):
+            if isinstance(position, FocusGame):
+                position = position.to_bytes()
+            self.encode_record(position, out[index])
+        return out
+
+
+def self_play_samples(p1_spec, p2_spec, games, seed=0, max_moves=MAX_GAME_MOVES, rules=None):
+    """
+    Generates (record, side, action, outcome) samples from
+    games between two simulate.py policy specs: the to_bytes
+    record before the move, the side making it, its action
+    number and +1, -1 or 0 as that side won, lost or drew.
+    Only the records of the game being played are held,
+    they are yielded once the outcome is known
+    """
+    rng = random.Random(seed)
+    for game_index in range(games):
+        game = FocusGame(PLAYERS[0], PLAYERS[1], rules)
+        policies = [make_policy(p1_spec, PLAYERS[0][0], rng.getrandbits(32)),
+                    make_policy(p2_spec, PLAYERS[1][0], rng.getrandbits(32))]
+        samples = []
+        side = game_index % 2
+        winner = None
+        while len(samples) < max_moves:
+            move = policies[side].choose_move(game)
+            if move is None:
+                winner = 1 - side
+                break
+            samples.append((game.to_bytes(), side, game.get_rules().move_to_index(move)))
+            game.apply_move(PLAYERS[side][0], move)
+            if game.is_game_over():
+                winner = side
+                break
+            side = 1 - side
+        for record, mover, action in samples:
+            outcome = 0 if winner is None else (1 if winner == mover else -1)
+            yield record, mover, action, outcome
+
+
+class ShardWriter:
+    """
+    Represents a directory of training data shards, each
+    shard is three .npy files (states, actions, outcomes)
+    written through memory maps of shard_size rows, so only
+    the current shard's pages are ever in memory
+    """
+
+    def __init__(self, directory, shard_size=65536, encoder=None):
+        """
+        Creates the directory for samples encoded by the
+        encoder (uint8 planes of the standard rules if none)
+        """
+        if encoder is None:
+            encoder = PositionEncoder(dtype=np.uint8)
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._shard_size = shard_size
+        self._encoder = encoder
+        self._shards = []
+        self._arrays = None
+        self._row = 0
+        self._count = 0
+
+    def _path(self, name, shard):
+        return os.path.join(self._directory, "{}_{:05d}.npy".format(name, shard))
+
+    def _open_shard(self):
+        """
+        Creates the memory mapped files of the next shard
+        """
+        shard = len(self._shards)
+        self._arrays = (
+            np.lib.format.open_memmap(self._path("states", shard), mode="w+", dtype=self._encoder.dtype,
+                                      shape=(self._shard_size,) + self._encoder.shape),
+            np.lib.format.open_memmap(self._path("actions", shard), mode="w+", dtype=np.int16,
+                                      shape=(self._shard_size,)),
+            np.lib.format.open_memmap(self._path("outcomes", shard), mode="w+", dtype=np.int8,
+                                      shape=(self._shard_size,)),
+        )
+        self._shards.append(0)
+        self._row = 0
+
+    def _close_shard(self):
+        """
+        Flushes the current shard, a partly filled
+        shard is rewritten at its real length
+        """
+        shard = len(self._shards) - 1
+        rows = self._row
+        names = ("states", "actions", "outcomes")
+        for name, array in zip(names, self._arrays):
+            array.flush()
+            if rows < self._shard_size:
+                trimmed = np.lib.format.open_memmap(self._path(name, shard) + ".tmp", mode="w+",
+                                                    dtype=array.dtype, shape=(rows,) + array.shape[1:])
+                trimmed[...] = array[:rows]
+                trimmed.flush()
+        self._arrays = None
+        array = None
+        trimmed = None
+        if rows < self._shard_size:
+            for name in names:
+                os.replace(self._path(name, shard) + ".tmp", self._path(name, shard))
+        self._shards[shard] = rows
+
+    def write(self, record, side, action, outcome):
+        """
+        Encodes and writes one sample
+        """
+        if self._arrays is None:
+            self._open_shard()
+        states, actions, outcomes = self._arrays
+        self._encoder.encode_record(record, states[self._row], side)
+        actions[self._row] = action
+        outcomes[self._row] = outcome
+        self._row += 1
+        self._count += 1
+        if self._row == self._shard_size:
+            self._close_shard()
+
+    def get_count(self):
+        """
+        Returns the number of samples written
+        """
+        return self._count
+
+    def close(self):
+        """
+        Closes the last shard and writes the manifest
+        listing the rows in every shard
+        """
+        if self._arrays is not None:
+            self._close_shard()
+        with open(os.path.join(self._directory, MANIFEST), "w") as manifest:
+            json.dump({"shape": list(self._encoder.shape), "dtype": self._encoder.dtype.str,
+                       "shards": self._shards}, manifest)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_shards(samples, directory, shard_size=65536, encoder=None):
+    """
+    Writes samples as made by self_play_samples into
+    shards in the directory, returns the number written
+    """
+    with ShardWriter(directory, shard_size, encoder) as writer:
+        for sample in samples:
+            writer.write(*sample)
+        return writer.get_count()
+
+
+def load_shards(directory):
+    """
+    Generates (states, actions, outcomes) read-only
+    memory maps for every shard in the directory
+    """
+    with open(os.path.join(directory, MANIFEST)) as manifest:
+        shards = json.load(manifest)["shards"]
+    for shard in range(len(shards)):
+        yield tuple(np.load(os.path.join(directory, "{}_{:05d}.npy".format(name, shard)), mmap_mode="r")
+                    for name in ("states", "actions", "outcomes"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write self-play training data shards")
+    parser.add_argument("directory", help="directory for the shards")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--p1", default="random", help="random, greedy, search[:seconds] or mcts[:playouts]")
+    parser.add_argument("--p2", default="random", help="random, greedy, search[:seconds] or mcts[:playouts]")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--shard-size", type=int, default=65536)
+    args = parser.parse_args()
+    samples = self_play_samples(args.p1, args.p2, args.games, args.seed)
+    print("{} samples".format(write_shards(samples, args.directory, args.shard_size)))
+
+
+if __name__ == "__main__":
+    main()
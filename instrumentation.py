@@ -0,0 +1,222 @@
+# Opt-in counters, histograms and profiling for FocusGame
+#
+# with collect_stats() as stats:
+#     play some games
+# print(stats.to_prometheus())
+
+# Required Moduels
+import cProfile
+import io
+import math
+import pstats
+from contextlib import contextmanager
+
+from FocusGame import FocusGame
+
+# histogram bucket upper bounds, timings are in seconds
+TIME_BUCKETS = (1e-6, 2e-6, 5e-6, 1e-5, 2e-5, 5e-5, 1e-4, 1e-3, math.inf)
+SIZE_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 12, math.inf)
+
+# one line descriptions for the Prometheus export
+HELP = {
+    "move_rejected": "moves rejected by move_piece or reserved_move, by reason",
+    "overflows": "moves pushing a stack past the stack limit",
+    "overflow_reserved": "pawns sent to a reserve by overflows",
+    "overflow_captured": "pawns captured by overflows",
+    "reserve_placements": "pawns placed from a reserve",
+    "stack_moves": "stack moves made",
+    "legal_moves_calls": "legal move generations started",
+    "move_piece_seconds": "time of a successful move_piece call",
+    "stack_walk_pawns": "pawns split off the start stack by a move",
+    "stack_height": "height of the stack a move lands on",
+    "overflow_pawns": "pawns pushed off the bottom by an overflow",
+}
+
+
+class Histogram:
+    """
+    Represents a histogram of observed
+    values counted in fixed buckets
+    """
+    __slots__ = ("bounds", "counts", "total", "observations")
+
+    def __init__(self, bounds):
+        """
+        Creates an empty histogram with the
+        bucket upper bounds given in order
+        """
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.total = 0
+        self.observations = 0
+
+    def observe(self, value):
+        """
+        Counts the value in the first bucket holding it
+        """
+        for index, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.total += value
+        self.observations += 1
+
+
+class GameStats:
+    """
+    Represents the counters and histograms filled by the
+    FocusGame hot paths while it is installed (see
+    enable_stats), each process keeps its own
+    """
+
+    def __init__(self):
+        """
+        Creates empty statistics
+        """
+        self._counters = {}
+        self._histograms = {}
+
+    def count(self, name, amount=1, reason=None):
+        """
+        Adds the amount to a counter, counters
+        with a reason are kept per reason
+        """
+        key = (name, reason)
+        self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value):
+        """
+        Adds a value to a histogram, names ending
+        in _seconds use the timing buckets
+        """
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            histogram = Histogram(TIME_BUCKETS if name.endswith("_seconds") else SIZE_BUCKETS)
+            self._histograms[name] = histogram
+        histogram.observe(value)
+
+    def get_count(self, name, reason=None):
+        """
+        Returns the value of a counter, the sum
+        over every reason when none is given
+        """
+        if reason is not None:
+            return self._counters.get((name, reason), 0)
+        return sum(value for (counter, why), value in self._counters.items() if counter == name)
+
+    def reset(self):
+        """
+        Clears every counter and histogram
+        """
+        self._counters = {}
+        self._histograms = {}
+
+    def to_dict(self):
+        """
+        Returns the statistics as a dict of counters (a
+        dict by reason for counters with reasons) and
+        histograms (bucket bounds and counts, sum and count)
+        """
+        counters = {}
+        for (name, reason), value in sorted(self._counters.items(), key=lambda item: (item[0][0], item[0][1] or "")):
+            if reason is None:
+                counters[name] = value
+            else:
+                counters.setdefault(name, {})[reason] = value
+        histograms = {}
+        for name, histogram in sorted(self._histograms.items()):
+            histograms[name] = {
+                "buckets": [[bound, count] for bound, count in zip(histogram.bounds, histogram.counts)],
+                "sum": histogram.total,
+                "count": histogram.observations,
+            }
+        return {"counters": counters, "histograms": histograms}
+
+    def to_prometheus(self, prefix="focus_"):
+        """
+        Returns the statistics in the Prometheus text
+        format, counters get a _total suffix and
+        histogram buckets are cumulative
+        """
+        lines = []
+        data = self.to_dict()
+        for name, value in data["counters"].items():
+            metric = prefix + name + "_total"
+            if name in HELP:
+                lines.append("# HELP {} {}".format(metric, HELP[name]))
+            lines.append("# TYPE {} counter".format(metric))
+            if isinstance(value, dict):
+                for reason, count in value.items():
+                    lines.append('{}{{reason="{}"}} {}'.format(metric, reason, count))
+            else:
+                lines.append("{} {}".format(metric, value))
+        for name, histogram in data["histograms"].items():
+            metric = prefix + name
+            if name in HELP:
+                lines.append("# HELP {} {}".format(metric, HELP[name]))
+            lines.append("# TYPE {} histogram".format(metric))
+            cumulative = 0
+            for bound, count in histogram["buckets"]:
+                cumulative += count
+                label = "+Inf" if bound == math.inf else repr(bound)
+                lines.append('{}_bucket{{le="{}"}} {}'.format(metric, label, cumulative))
+            lines.append("{}_sum {}".format(metric, histogram["sum"]))
+            lines.append("{}_count {}".format(metric, histogram["count"]))
+        return "\n".join(lines) + "\n"
+
+
+def enable_stats(stats=None):
+    """
+    Installs statistics for every FocusGame
+    (a new GameStats unless one is given)
+    and returns them
+    """
+    if stats is None:
+        stats = GameStats()
+    FocusGame._stats = stats
+    return stats
+
+
+def disable_stats():
+    """
+    Removes the installed statistics, the hot
+    paths go back to a single None check
+    """
+    FocusGame._stats = None
+
+
+@contextmanager
+def collect_stats(stats=None):
+    """
+    Context manager collecting statistics for
+    the games played inside it, yields them
+    """
+    previous = FocusGame._stats
+    stats = enable_stats(stats)
+    try:
+        yield stats
+    finally:
+        FocusGame._stats = previous
+
+
+@contextmanager
+def profile_games(path=None, sort="cumulative", limit=25, out=None):
+    """
+    Context manager running cProfile over the games
+    played inside it. The raw profile is dumped to the
+    path if one is given, otherwise the top functions
+    (by the sort key) are printed to out (stdout).
+    Yields the profiler
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if path is not None:
+            profiler.dump_stats(path)
+        else:
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats(sort).print_stats(limit)
+            print(stream.getvalue(), file=out)
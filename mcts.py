@@ -0,0 +1,236 @@
+# Monte Carlo Tree Search player for FocusGame
+
+# Required Moduels
+import math
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from search import get_sides, order_moves
+
+# longest playout before it is scored as a draw
+MAX_PLAYOUT_MOVES = 200
+
+
+class Node:
+    """
+    Represents a position in the search tree,
+    wins are counted for the player who made
+    the move leading to the node
+    """
+    __slots__ = ("move", "player", "parent", "children", "untried", "visits", "wins")
+
+    def __init__(self, move, player, parent):
+        """
+        Creates a node for the move made by the player
+        """
+        self.move = move
+        self.player = player
+        self.parent = parent
+        self.children = []
+        self.untried = None
+        self.visits = 0
+        self.wins = 0.0
+
+    def select_child(self, exploration):
+        """
+        Returns the child with the best UCT score
+        """
+        log_visits = math.log(self.visits)
+        best = None
+        best_score = -1.0
+        for child in self.children:
+            score = child.wins / child.visits + exploration * math.sqrt(log_visits / child.visits)
+            if score > best_score:
+                best = child
+                best_score = score
+        return best
+
+
+def player_to_move(game, default):
+    """
+    Returns the name of the player to move, the
+    default player is used before the first move
+    """
+    turn = game.whos_turn_is_it()
+    if turn is None:
+        return default
+    return turn
+
+
+def playout(game, player, rng, heuristic, max_moves=MAX_PLAYOUT_MOVES):
+    """
+    Plays moves from the position until a player captures
+    6 pieces or cannot move and returns the winner (None for
+    a draw), the moves are taken back before returning
+    """
+    played = 0
+    winner = None
+    try:
+        while played < max_moves:
+            moves = list(game.legal_moves(player))
+            if len(moves) == 0:
+                winner = get_sides(game, player)[1]
+                break
+            if heuristic and rng.random() < 0.5:
+                move = order_moves(game, moves, get_sides(game, player)[0])[0]
+            else:
+                move = moves[rng.randrange(len(moves))]
+            game.apply_move(player, move)
+            played += 1
+            if game.is_game_over():
+                winner = player
+                break
+            player = game.whos_turn_is_it()
+    finally:
+        for i in range(played):
+            game.undo_move()
+    return winner
+
+
+def run_tree(game, player, playouts, time_limit, seed, exploration=1.4, heuristic=False):
+    """
+    Runs MCTS from the position for the player and returns
+    a dict of the root moves with their (visits, wins)
+    """
+    rng = random.Random(seed)
+    deadline = None
+    if time_limit is not None:
+        deadline = time.perf_counter() + time_limit
+    root = Node(None, None, None)
+    root.untried = list(game.legal_moves(player))
+    rng.shuffle(root.untried)
+
+    for i in range(playouts):
+        if deadline is not None and i > 0 and time.perf_counter() > deadline:
+            break
+        node = root
+        to_move = player
+        depth = 0
+        winner = None
+
+        # selection, follow UCT while every move has been tried
+        while not node.untried and node.children:
+            node = node.select_child(exploration)
+            game.apply_move(to_move, node.move)
+            depth += 1
+            to_move = game.whos_turn_is_it()
+
+        # expansion, unless the game is over at the node
+        if game.is_game_over():
+            winner = node.player
+        elif node.untried:
+            move = node.untried.pop()
+            child = Node(move, to_move, node)
+            node.children.append(child)
+            node = child
+            game.apply_move(to_move, move)
+            depth += 1
+            if game.is_game_over():
+                winner = to_move
+            else:
+                to_move = game.whos_turn_is_it()
+                child.untried = list(game.legal_moves(to_move))
+                rng.shuffle(child.untried)
+
+        # simulation
+        if winner is None:
+            if node.untried is not None and not node.untried and not node.children:
+                winner = get_sides(game, to_move)[1]
+            else:
+                winner = playout(game, to_move, rng, heuristic)
+        for j in range(depth):
+            game.undo_move()
+
+        # backpropagation
+        while node is not None:
+            node.visits += 1
+            if winner is None:
+                node.wins += 0.5
+            elif winner == node.player:
+                node.wins += 1.0
+            node = node.parent
+
+    return {child.move: (child.visits, child.wins) for child in root.children}
+
+
+class MCTSPlayer:
+    """
+    Represents a computer player choosing moves with
+    Monte Carlo Tree Search (UCT). With more than one
+    worker every process grows its own tree from the
+    position and the root statistics are summed
+    """
+
+    def __init__(self, name, playouts=1000, time_limit=None, workers=1,
+                 exploration=1.4, heuristic=False, seed=None):
+        """
+        Creates a player for the name running up to the
+        number of playouts per worker per move, stopping
+        early at the time limit in seconds if one is given,
+        raises ValueError for fewer than one playout
+        """
+        if playouts < 1:
+            raise ValueError("playouts must be at least 1")
+        self._name = name
+        self._playouts = playouts
+        self._time_limit = time_limit
+        self._workers = workers
+        self._exploration = exploration
+        self._heuristic = heuristic
+        self._random = random.Random(seed)
+        self._executor = None
+
+    def get_name(self):
+        """
+        returns the name of the player
+        """
+        return self._name
+
+    def choose_move(self, game):
+        """
+        Returns the most visited root move,
+        or None if the player cannot move
+        """
+        player = player_to_move(game, self._name)
+        moves = list(game.legal_moves(player))
+        if len(moves) <= 1:
+            return moves[0] if moves else None
+
+        if self._workers <= 1:
+            totals = run_tree(game, player, self._playouts, self._time_limit,
+                              self._random.getrandbits(32), self._exploration, self._heuristic)
+        else:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self._workers)
+            futures = [self._executor.submit(run_tree, game, player, self._playouts, self._time_limit,
+                                             self._random.getrandbits(32), self._exploration,
+                                             self._heuristic)
+                       for i in range(self._workers)]
+            totals = {}
+            for future in futures:
+                for move, (visits, wins) in future.result().items():
+                    total = totals.get(move, (0, 0.0))
+                    totals[move] = (total[0] + visits, total[1] + wins)
+
+        return max(totals, key=lambda move: totals[move][0])
+
+    def play_move(self, game):
+        """
+        Chooses a move and makes it with move_piece or
+        reserved_move, returns the result of that call
+        """
+        move = self.choose_move(game)
+        if move is None:
+            return False
+        if move[0] is None:
+            return game.reserved_move(self._name, move[1])
+        return game.move_piece(self._name, move[0], move[1], move[2])
+
+    def close(self):
+        """
+        Shuts down the worker processes
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,197 @@
+# Opening book for FocusGame built from self-play results
+#
+# to build from games recorded with simulate.py --record-moves:
+# python3 opening_book.py results.jsonl book.bin --plies 12
+
+# Required Moduels
+import argparse
+import json
+import mmap
+import struct
+
+from FocusGame import FocusGame, move_to_index, index_to_move
+from simulate import PLAYERS
+
+# file header: magic, version and entry count
+HEADER = struct.Struct("<5sBI")
+MAGIC = b"FBOOK"
+VERSION = 1
+
+# entry: position hash, move number (see move_to_index), visits, wins
+ENTRY = struct.Struct("<QHII")
+KEY = struct.Struct("<Q")
+
+
+def collect_statistics(results, max_plies, statistics=None):
+    """
+    Replays the first moves of recorded games (dicts as
+    written by simulate.py with moves) and returns a dict of
+    (position hash, move number) to [visits, wins], a win
+    meaning the player making the move won the game
+    """
+    if statistics is None:
+        statistics = {}
+    for result in results:
+        game = FocusGame(*PLAYERS)
+        player = result["first"]
+        for start_pos, end_pos, num_pawns in result["moves"][:max_plies]:
+            if start_pos is None:
+                move = (None, tuple(end_pos), num_pawns)
+            else:
+                move = (tuple(start_pos), tuple(end_pos), num_pawns)
+            entry = statistics.setdefault((game.get_hash(), move_to_index(move)), [0, 0])
+            entry[0] += 1
+            if result["winner"] == player:
+                entry[1] += 1
+            game.apply_move(player, move)
+            if game.is_game_over():
+                break
+            player = game.whos_turn_is_it()
+    return statistics
+
+
+def write_book(path, statistics, min_visits=1):
+    """
+    Writes the statistics sorted by position hash,
+    skipping moves seen fewer than min_visits times.
+    Returns the number of entries written
+    """
+    entries = sorted((key, move, visits, wins)
+                     for (key, move), (visits, wins) in statistics.items()
+                     if visits >= min_visits)
+    with open(path, "wb") as book:
+        book.write(HEADER.pack(MAGIC, VERSION, len(entries)))
+        for entry in entries:
+            book.write(ENTRY.pack(*entry))
+    return len(entries)
+
+
+def build_book(results_path, book_path, max_plies=12, min_visits=1):
+    """
+    Builds a book file from a JSONL file of recorded
+    games, returns the number of entries written
+    """
+    with open(results_path) as results:
+        games = (json.loads(line) for line in results if line.strip())
+        statistics = collect_statistics((game for game in games if "moves" in game), max_plies)
+    return write_book(book_path, statistics, min_visits)
+
+
+class OpeningBook:
+    """
+    Represents a memory mapped book of move statistics
+    sorted by position hash, looked up by binary search
+    """
+
+    def __init__(self, path):
+        """
+        Maps the book file at the path
+        """
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("{} is not a version {} opening book".format(path, VERSION))
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def lookup(self, key):
+        """
+        Returns a list of (move, visits, wins) stored for
+        the position hash, empty if the position is unknown
+        """
+        # find the first entry with the key
+        low = 0
+        high = self._count
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(self._map, HEADER.size + middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        moves = []
+        for index in range(low, self._count):
+            entry_key, move, visits, wins = ENTRY.unpack_from(self._map, HEADER.size + index * ENTRY.size)
+            if entry_key != key:
+                break
+            moves.append((index_to_move(move), visits, wins))
+        return moves
+
+    def choose_move(self, game, player, min_visits=10):
+        """
+        Returns the legal book move for the player with the
+        best win rate among moves played at least min_visits
+        times, or None so the caller can fall back to search
+        """
+        legal = set(game.legal_moves(player))
+        best = None
+        best_rate = -1.0
+        for move, visits, wins in self.lookup(game.get_hash()):
+            if visits >= min_visits and move in legal and wins / visits > best_rate:
+                best = move
+                best_rate = wins / visits
+        return best
+
+    def close(self):
+        """
+        Releases the map and closes the file
+        """
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class BookPlayer:
+    """
+    Represents a player taking moves from an opening
+    book while it can and asking another player
+    (search, MCTS, ...) for the rest
+    """
+
+    def __init__(self, book, fallback, min_visits=10):
+        """
+        Creates a player using the book and falling back
+        to the player given, whose name is used
+        """
+        self._book = book
+        self._fallback = fallback
+        self._min_visits = min_visits
+
+    def get_name(self):
+        """
+        returns the name of the player
+        """
+        return self._fallback.get_name()
+
+    def choose_move(self, game):
+        """
+        Returns the book move if there is one,
+        otherwise the move of the fallback player
+        """
+        move = self._book.choose_move(game, self.get_name(), self._min_visits)
+        if move is None:
+            move = self._fallback.choose_move(game)
+        return move
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build an opening book from recorded games")
+    parser.add_argument("results", help="JSONL from simulate.py --record-moves")
+    parser.add_argument("book", help="book file to write")
+    parser.add_argument("--plies", type=int, default=12)
+    parser.add_argument("--min-visits", type=int, default=1)
+    args = parser.parse_args()
+    print("{} entries".format(build_book(args.results, args.book, args.plies, args.min_visits)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# Packed record files of FocusGame positions
+
+# Required Moduels
+import mmap
+import struct
+
+from FocusGame import FocusGame, STANDARD_RULES, NO_TURN
+
+# file header: magic, version and record size
+HEADER = struct.Struct("<5sBH")
+MAGIC = b"FOCUS"
+VERSION = 1
+
+
+def decode_record(record, rules=STANDARD_RULES):
+    """
+    Returns (stacks, reserves, captures, turn, game over)
+    for a record, stacks are the packed stack bytes (36 in
+    the standard game) and the turn is None before the
+    first move
+    """
+    counters = rules.record_size - 6
+    turn = record[counters + 4]
+    return (bytes(record[:counters]),
+            (record[counters], record[counters + 1]),
+            (record[counters + 2], record[counters + 3]),
+            None if turn == NO_TURN else turn,
+            bool(record[counters + 5]))
+
+
+class RecordWriter:
+    """
+    Represents a file of fixed size position
+    records being written one after another
+    """
+
+    def __init__(self, path, rules=STANDARD_RULES):
+        """
+        Creates the file at the path for positions
+        under the rules and writes the header
+        """
+        self._record_size = rules.record_size
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, VERSION, self._record_size))
+        self._count = 0
+
+    def write(self, position):
+        """
+        Writes a FocusGame position or a
+        record made by FocusGame.to_bytes
+        """
+        if isinstance(position, FocusGame):
+            position = position.to_bytes()
+        if len(position) != self._record_size:
+            raise ValueError("records are {} bytes".format(self._record_size))
+        self._file.write(position)
+        self._count += 1
+
+    def get_count(self):
+        """
+        Returns the number of records written
+        """
+        return self._count
+
+    def close(self):
+        """
+        Closes the file
+        """
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_records(path, positions, rules=STANDARD_RULES):
+    """
+    Writes the positions (games or records)
+    to a new file, returns how many were written
+    """
+    with RecordWriter(path, rules) as writer:
+        for position in positions:
+            writer.write(position)
+        return writer.get_count()
+
+
+class RecordFile:
+    """
+    Represents a memory mapped file of position records,
+    records are read as memoryview slices of the map so
+    no game objects are made unless asked for. A record
+    stays valid after close while it is referenced: the map
+    is then left for the garbage collector to unmap once the
+    last record is dropped
+    """
+
+    def __init__(self, path, rules=STANDARD_RULES):
+        """
+        Maps the file at the path and checks the
+        header against the rules of the positions
+        """
+        self._rules = rules
+        self._record_size = rules.record_size
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION or record_size != self._record_size:
+            self.close()
+            raise ValueError("{} is not a version {} record file".format(path, VERSION))
+        self._view = memoryview(self._map)[HEADER.size:]
+        self._count = len(self._view) // self._record_size
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        """
+        Returns the record at the index as a memoryview
+        """
+        if index < 0:
+            index += self._count
+        if index < 0 or index >= self._count:
+            raise IndexError("record index out of range")
+        record_size = self._record_size
+        return self._view[index * record_size:(index + 1) * record_size]
+
+    def __iter__(self):
+        record_size = self._record_size
+        for offset in range(0, self._count * record_size, record_size):
+            yield self._view[offset:offset + record_size]
+
+    def decode(self, index):
+        """
+        Returns the decoded record at the index (see decode_record)
+        """
+        return decode_record(self[index], self._rules)
+
+    def game(self, index, p1, p2):
+        """
+        Returns a FocusGame for the players
+        at the position of the record
+        """
+        return FocusGame.from_bytes(self[index], p1, p2, self._rules)
+
+    def close(self):
+        """
+        Releases the map and closes the file, the map
+        is kept while records read from it are referenced
+        """
+        if hasattr(self, "_view"):
+            self._view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            # records still point into the map
+            pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,269 @@
+# Alpha-beta search player for FocusGame
+
+# Required Moduels
+import time
+
+from transposition import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND
+
+WIN_SCORE = 100000
+INFINITY = WIN_SCORE + 1000
+# scores past the threshold are wins a number of plies away
+WIN_THRESHOLD = WIN_SCORE - 1000
+
+# evaluation weights
+CAPTURE_WEIGHT = 100
+RESERVE_WEIGHT = 40
+CONTROL_WEIGHT = 10
+TALL_STACK_WEIGHT = 15
+MOBILITY_WEIGHT = 1
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search when the
+    time budget for the move is spent
+    """
+
+
+def get_sides(game, player):
+    """
+    Returns the (side, opponent name) of the player,
+    side is the index of the player in getPlayers
+    """
+    side = game.get_side(player)
+    return side, game.getPlayers()[1 - side].get_name()
+
+
+def evaluate(game, player):
+    """
+    Scores the position for the player, counting
+    captures, reserve, controlled squares, tall stacks
+    and stack moves against the opponent, all read
+    from the features the game keeps up to date
+    """
+    side, opponent = get_sides(game, player)
+    score = CAPTURE_WEIGHT * (game.show_captured(player) - game.show_captured(opponent))
+    score += RESERVE_WEIGHT * (game.show_reserve(player) - game.show_reserve(opponent))
+    features = game.get_features()
+    score += CONTROL_WEIGHT * (features.controlled[side] - features.controlled[1 - side])
+    score += TALL_STACK_WEIGHT * (features.tall_stacks[side] - features.tall_stacks[1 - side])
+    score += MOBILITY_WEIGHT * (features.mobility[side] - features.mobility[1 - side])
+    return score
+
+
+def score_to_table(score, ply):
+    """
+    Returns the score to store for a node at the ply,
+    win scores count plies from the node instead of the root
+    """
+    if score >= WIN_THRESHOLD:
+        return score + ply
+    if score <= -WIN_THRESHOLD:
+        return score - ply
+    return score
+
+
+def score_from_table(value, ply):
+    """
+    Returns the score of a stored value for a
+    node at the ply, the inverse of score_to_table
+    """
+    if value >= WIN_THRESHOLD:
+        return value - ply
+    if value <= -WIN_THRESHOLD:
+        return value + ply
+    return value
+
+
+def order_moves(game, moves, side, first=None):
+    """
+    Sorts the moves so that the first move (the
+    best move found earlier) comes first, then moves
+    that capture the most pawns, then moves that push
+    pawns past the stack limit, then the rest
+    """
+    rules = game.get_rules()
+    board_size = rules.get_board_size()
+    stack_limit = rules.get_stack_limit()
+    cells = game.getBoard().get_cells()
+    scored = []
+    for move in moves:
+        if move == first:
+            score = 1000
+        elif move[0] is None:
+            score = -1
+        else:
+            cell = cells[move[1][0] * board_size + move[1][1]]
+            overflow = (cell & rules.height_mask) + move[2] - stack_limit
+            score = 0
+            if overflow > 0:
+                # the overflow is the bottom of the end stack
+                opponent_pawns = bin((cell >> rules.height_bits) & ((1 << overflow) - 1)).count("1")
+                if side == 1:
+                    opponent_pawns = overflow - opponent_pawns
+                score = 10 * opponent_pawns + overflow
+        scored.append((score, move))
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [move for score, move in scored]
+
+
+class AlphaBetaPlayer:
+    """
+    Represents a computer player choosing moves with
+    an iterative deepening negamax alpha-beta search
+    limited by a wall clock budget per move
+    """
+
+    def __init__(self, name, time_limit=0.05, max_depth=32, table=None):
+        """
+        Creates a player for the name with a time
+        limit in seconds per move, a transposition
+        table can be shared between players
+        """
+        self._name = name
+        self._time_limit = time_limit
+        self._max_depth = max_depth
+        if table is None:
+            table = TranspositionTable(16)
+        self._table = table
+        self._deadline = 0
+        self._nodes = 0
+        self._depth_reached = 0
+
+    def get_name(self):
+        """
+        returns the name of the player
+        """
+        return self._name
+
+    def get_stats(self):
+        """
+        Returns a dict with the nodes searched and
+        the depth completed for the last move
+        """
+        return {"nodes": self._nodes, "depth": self._depth_reached}
+
+    def choose_move(self, game):
+        """
+        Returns the best move found within the time
+        limit, or None if the player cannot move
+        """
+        self._deadline = time.perf_counter() + self._time_limit
+        self._nodes = 0
+        self._depth_reached = 0
+        self._table.new_search()
+
+        player = self._name
+        side, opponent = get_sides(game, player)
+        moves = list(game.legal_moves(player))
+        if len(moves) <= 1:
+            return moves[0] if moves else None
+
+        best_move = order_moves(game, moves, side)[0]
+        for depth in range(1, self._max_depth + 1):
+            try:
+                score, move = self._search_root(game, player, opponent, side, moves, depth, best_move)
+            except SearchTimeout:
+                break
+            best_move = move
+            self._depth_reached = depth
+            if abs(score) >= WIN_SCORE - self._max_depth:
+                break
+        return best_move
+
+    def play_move(self, game):
+        """
+        Chooses a move and makes it with move_piece or
+        reserved_move, returns the result of that call
+        """
+        move = self.choose_move(game)
+        if move is None:
+            return False
+        if move[0] is None:
+            return game.reserved_move(self._name, move[1])
+        return game.move_piece(self._name, move[0], move[1], move[2])
+
+    def _search_root(self, game, player, opponent, side, moves, depth, first):
+        """
+        Searches every root move to the depth and
+        returns the (score, move) of the best one
+        """
+        alpha = -INFINITY
+        best_move = first
+        for move in order_moves(game, moves, side, first):
+            game.apply_move(player, move)
+            try:
+                if game.is_game_over():
+                    score = WIN_SCORE - 1
+                else:
+                    score = -self._negamax(game, opponent, player, depth - 1, -INFINITY, -alpha, 1)
+            finally:
+                game.undo_move()
+            if score > alpha:
+                alpha = score
+                best_move = move
+        self._table.store(game.get_hash(), depth, alpha, EXACT, best_move)
+        return alpha, best_move
+
+    def _negamax(self, game, player, opponent, depth, alpha, beta, ply):
+        """
+        Returns the score of the position for the
+        player to move searched to the depth
+        """
+        self._nodes += 1
+        if time.perf_counter() > self._deadline:
+            raise SearchTimeout()
+
+        # use the stored result if it is deep enough
+        key = game.get_hash()
+        entry = self._table.lookup(key)
+        first = None
+        if entry is not None:
+            entry_depth, value, bound, first = entry
+            value = score_from_table(value, ply)
+            if entry_depth >= depth:
+                if bound == EXACT:
+                    return value
+                if bound == LOWER_BOUND and value >= beta:
+                    return value
+                if bound == UPPER_BOUND and value <= alpha:
+                    return value
+
+        if depth == 0:
+            return evaluate(game, player)
+
+        # a player without a move has lost
+        side = get_sides(game, player)[0]
+        moves = list(game.legal_moves(player))
+        if len(moves) == 0:
+            return ply - WIN_SCORE
+
+        alpha_start = alpha
+        best = -INFINITY
+        best_move = None
+        for move in order_moves(game, moves, side, first):
+            game.apply_move(player, move)
+            try:
+                if game.is_game_over():
+                    score = WIN_SCORE - ply - 1
+                else:
+                    score = -self._negamax(game, opponent, player, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                game.undo_move()
+            if score > best:
+                best = score
+                best_move = move
+            if best > alpha:
+                alpha = best
+            if alpha >= beta:
+                break
+
+        # remember the result and how it relates to the window
+        if best <= alpha_start:
+            bound = UPPER_BOUND
+        elif best >= beta:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        self._table.store(key, depth, score_to_table(best, ply), bound, best_move)
+        return best
@@ -0,0 +1,474 @@
+# Asyncio game server hosting FocusGame matches over a line protocol
+#
+# to run:
+# python3 server.py --port 8765 --workers 4
+#
+# every request and reply is one JSON object per line, ex:
+# {"cmd": "new", "opponent": "search:0.05"}
+# {"cmd": "move", "game": 1, "start": [0, 0], "end": [0, 1], "count": 1}
+# {"cmd": "reserve", "game": 1, "location": [2, 3]}
+# {"cmd": "state", "game": 1}
+# {"cmd": "join", "game": 1} (second human player)
+# {"cmd": "leave", "game": 1}
+# a request "id" is copied to its reply, moves made by the
+# other player arrive as {"event": "move", ...} lines, with
+# the change of position as a hex encode_delta "delta" a
+# client or replica can apply_delta instead of asking for state,
+# a state reply has the "move" number and hex to_bytes "record"
+# to start a replica from (FocusGame.from_bytes with the move
+# number) and a move reply has the "delta" of the client's move
+# a bot that fails closes its game with an {"event": "error"} line
+
+# Required Moduels
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from FocusGame import FocusGame, MoveResult, get_rules, encode_delta
+from simulate import PLAYERS
+
+# longest request line accepted from a client
+MAX_LINE = 4096
+
+HUMAN = "human"
+
+logger = logging.getLogger(__name__)
+
+# rules a client may ask for, as (smallest, largest),
+# the win captures go from 1 to the pawns of a side
+BOARD_SIZES = (4, 10)
+STACK_LIMITS = (2, 8)
+
+# bot opponents a client may ask for, with the
+# (smallest, largest) search seconds and playouts
+BOTS = ("random", "greedy", "search", "mcts")
+SEARCH_SECONDS = (0.001, 5.0)
+MCTS_PLAYOUTS = (1, 5000)
+
+
+def bot_move(spec, name, record, rules, seed):
+    """
+    Returns the move of the policy spec (as in simulate.py)
+    for the player name at the position of a to_bytes record,
+    run in a worker process so search never blocks the server
+    """
+    game = FocusGame.from_bytes(record, PLAYERS[0], PLAYERS[1], rules)
+    return make_policy(spec, name, seed).choose_move(game)
+
+
+class ProtocolError(Exception):
+    """
+    Raised for a request the server cannot
+    carry out, the message is sent to the client
+    """
+
+
+class Session:
+    """
+    Represents one match hosted by the server: the game,
+    the client connection of each side (None for a bot or
+    an open seat) and the bot policy spec if there is one
+    """
+    __slots__ = ("game_id", "game", "clients", "bot", "thinking", "winner", "seed", "delta")
+
+    def __init__(self, game_id, game, bot, seed):
+        """
+        Creates the session for a new game
+        """
+        self.game_id = game_id
+        self.game = game
+        self.clients = [None, None]
+        self.bot = bot
+        self.thinking = False
+        self.winner = None
+        self.seed = seed
+        self.delta = None
+        game.add_listener(self.changed)
+
+    def changed(self, game, delta):
+        """
+        Keeps the Delta of the last change of the game
+        """
+        self.delta = delta
+
+    def is_over(self):
+        """
+        Returns True once the game has a winner
+        """
+        return self.winner is not None
+
+
+def read_position(request, field):
+    """
+    Returns the (row, column) tuple of a request field
+    """
+    value = request.get(field)
+    if not isinstance(value, list) or len(value) != 2 or not all(isinstance(a, int) for a in value):
+        raise ProtocolError("{} must be [row, column]".format(field))
+    return (value[0], value[1])
+
+
+def read_rules(request):
+    """
+    Returns the GameRules of the request "rules"
+    [board size, stack limit, win captures], None
+    for the standard game when there is no field
+    """
+    value = request.get("rules")
+    if value is None:
+        return None
+    if not isinstance(value, list) or len(value) != 3 or not all(isinstance(a, int) for a in value):
+        raise ProtocolError("rules must be [board size, stack limit, win captures]")
+    board_size, stack_limit, win_captures = value
+    if not BOARD_SIZES[0] <= board_size <= BOARD_SIZES[1]:
+        raise ProtocolError("board size must be from {} to {}".format(*BOARD_SIZES))
+    if not STACK_LIMITS[0] <= stack_limit <= STACK_LIMITS[1]:
+        raise ProtocolError("stack limit must be from {} to {}".format(*STACK_LIMITS))
+    if not 1 <= win_captures <= (board_size * board_size + 1) // 2:
+        raise ProtocolError("win captures must be from 1 to the pawns of a side")
+    return get_rules(board_size, stack_limit, win_captures)
+
+
+def read_opponent(request):
+    """
+    Returns the policy spec (as in simulate.py) of the
+    request "opponent", None for a human opponent
+    """
+    value = request.get("opponent", HUMAN)
+    if value == HUMAN:
+        return None
+    if not isinstance(value, str):
+        raise ProtocolError("opponent must be a policy spec")
+    kind, _, argument = value.partition(":")
+    if kind not in BOTS:
+        raise ProtocolError("opponent must be one of {}".format(", ".join((HUMAN,) + BOTS)))
+    if kind == "search" and argument:
+        try:
+            seconds = float(argument)
+        except ValueError:
+            raise ProtocolError("search seconds must be a number")
+        if not math.isfinite(seconds) or not SEARCH_SECONDS[0] <= seconds <= SEARCH_SECONDS[1]:
+            raise ProtocolError("search seconds must be from {} to {}".format(*SEARCH_SECONDS))
+        return "search:{}".format(seconds)
+    if kind == "mcts" and argument:
+        try:
+            playouts = int(argument)
+        except ValueError:
+            raise ProtocolError("mcts playouts must be a number")
+        if not MCTS_PLAYOUTS[0] <= playouts <= MCTS_PLAYOUTS[1]:
+            raise ProtocolError("mcts playouts must be from {} to {}".format(*MCTS_PLAYOUTS))
+        return "mcts:{}".format(playouts)
+    if argument:
+        raise ProtocolError("{} takes no argument".format(kind))
+    return kind
+
+
+def send(writer, message):
+    """
+    Queues a message on a client connection,
+    closed connections are skipped
+    """
+    if writer is not None and not writer.is_closing():
+        writer.write(json.dumps(message).encode() + b"\n")
+
+
+class GameServer:
+    """
+    Represents a server running many concurrent sessions in
+    one event loop. Human moves are checked and made with
+    move_piece and reserved_move, bot moves are searched
+    in a process pool. Idle sessions hold no task, only
+    the game and the seats
+    """
+
+    def __init__(self, workers=None, seed=0):
+        """
+        Creates the server, workers is the size
+        of the process pool for bot moves
+        """
+        # workers are spawned rather than forked so they do not
+        # inherit client sockets and keep closed connections open
+        self._pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        self._sessions = {}
+        self._ids = itertools.count(1)
+        self._seed = seed
+        self._server = None
+        self._clients = {}
+
+    def get_session(self, game_id):
+        """
+        Returns the session with the id, None
+        if there is no such session
+        """
+        return self._sessions.get(game_id)
+
+    def session_count(self):
+        """
+        Returns the number of sessions hosted
+        """
+        return len(self._sessions)
+
+    async def start(self, host="127.0.0.1", port=8765):
+        """
+        Starts listening, returns the asyncio server
+        """
+        self._server = await asyncio.start_server(self.handle_client, host, port, limit=MAX_LINE)
+        return self._server
+
+    async def close(self):
+        """
+        Stops listening, disconnects the clients
+        and shuts the process pool down
+        """
+        if self._server is not None:
+            self._server.close()
+        for writer in list(self._clients):
+            writer.close()
+        await asyncio.gather(*self._clients.values(), return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+        self._pool.shutdown(cancel_futures=True)
+
+    async def handle_client(self, reader, writer):
+        """
+        Serves the requests of one client connection,
+        sessions it is seated in end when it leaves
+        """
+        self._clients[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                reply = self.handle_request(line, writer)
+                send(writer, reply)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            del self._clients[writer]
+            for session in [s for s in self._sessions.values() if writer in s.clients]:
+                self.leave(session, writer)
+            writer.close()
+
+    def handle_request(self, line, writer):
+        """
+        Returns the reply to one request line
+        """
+        request_id = None
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                raise ProtocolError("requests are JSON objects")
+            if not isinstance(request, dict):
+                raise ProtocolError("requests are JSON objects")
+            request_id = request.get("id")
+            command = request.get("cmd")
+            if command == "new":
+                reply = self.new_game(request, writer)
+            else:
+                game_id = request.get("game")
+                session = self._sessions.get(game_id) if isinstance(game_id, int) else None
+                if session is None:
+                    raise ProtocolError("no such game")
+                if command == "join":
+                    reply = self.join(session, writer)
+                elif command == "state":
+                    reply = self.state(session)
+                elif command in ("move", "reserve"):
+                    reply = self.play(session, request, writer)
+                elif command == "leave":
+                    self.leave(session, writer)
+                    reply = {"ok": True}
+                else:
+                    raise ProtocolError("unknown command {}".format(command))
+        except ProtocolError as error:
+            reply = {"ok": False, "error": str(error)}
+        if request_id is not None:
+            reply["id"] = request_id
+        return reply
+
+    def new_game(self, request, writer):
+        """
+        Creates a session with the client as p1 against
+        a bot policy spec or a human (who joins later),
+        a bot asked to move first starts searching at once
+        """
+        bot = read_opponent(request)
+        rules = read_rules(request)
+        # hosted games are never taken back, so no undo records are kept
+        game_id = next(self._ids)
+        session = Session(game_id, FocusGame(PLAYERS[0], PLAYERS[1], rules, undo_limit=0),
+                          bot, self._seed + game_id)
+        session.clients[0] = writer
+        self._sessions[game_id] = session
+        if session.bot is not None and request.get("first") == "bot":
+            self.schedule_bot(session)
+        return {"ok": True, "game": game_id, "player": PLAYERS[0][0], "color": PLAYERS[0][1]}
+
+    def join(self, session, writer):
+        """
+        Seats the client as p2 of a game against a human
+        """
+        if session.bot is not None or session.clients[1] is not None:
+            raise ProtocolError("game is full")
+        session.clients[1] = writer
+        send(session.clients[0], {"event": "joined", "game": session.game_id})
+        return {"ok": True, "game": session.game_id, "player": PLAYERS[1][0], "color": PLAYERS[1][1]}
+
+    def state(self, session):
+        """
+        Returns the position of a session with its move
+        number, the "delta" events of later moves follow on
+        from it (see FocusGame.restore_bytes)
+        """
+        game = session.game
+        board_size = game.get_rules().get_board_size()
+        board = [[game.getBoard().get_stack_view((x, y)) for y in range(board_size)] for x in range(board_size)]
+        return {"ok": True, "game": session.game_id, "board": board,
+                "turn": game.whos_turn_is_it(), "winner": session.winner, "move": game.get_move_number(),
+                "record": game.to_bytes().hex(),
+                "captured": [game.show_captured(name) for name, color in PLAYERS],
+                "reserve": [game.show_reserve(name) for name, color in PLAYERS]}
+
+    def play(self, session, request, writer):
+        """
+        Makes the move of a client once validate_move
+        accepts it, otherwise replies with the reason
+        (a MoveResult value such as "wrong_distance")
+        """
+        if writer not in session.clients:
+            raise ProtocolError("not a player of this game")
+        side = session.clients.index(writer)
+        name = PLAYERS[side][0]
+        game = session.game
+        if session.is_over():
+            raise ProtocolError("game is over")
+        if session.thinking:
+            raise ProtocolError("not your turn")
+
+        if request.get("cmd") == "move":
+            num_pawns = request.get("count")
+            if not isinstance(num_pawns, int):
+                raise ProtocolError("count must be a number")
+            move = (read_position(request, "start"), read_position(request, "end"), num_pawns)
+        else:
+            move = (None, read_position(request, "location"), 1)
+        result = game.validate_move(name, move)
+        if result is MoveResult.WRONG_TURN:
+            raise ProtocolError("not your turn")
+        if result is not MoveResult.OK:
+            raise ProtocolError("illegal move: {}".format(result.value))
+        if move[0] is None:
+            game.reserved_move(name, move[1])
+        else:
+            game.move_piece(name, move[0], move[1], move[2])
+
+        delta = encode_delta(session.delta, game.get_rules()).hex()
+        self.moved(session, side, move)
+        return {"ok": True, "game": session.game_id, "winner": session.winner, "delta": delta}
+
+    def moved(self, session, side, move):
+        """
+        Tells the other side about a move, ends the game
+        if the mover won or the other side cannot move,
+        otherwise lets a bot opponent answer
+        """
+        game = session.game
+        other = 1 - side
+        if game.is_game_over():
+            session.winner = PLAYERS[side][0]
+        elif next(game.legal_moves(PLAYERS[other][0]), None) is None:
+            session.winner = PLAYERS[side][0]
+        event = {"event": "move", "game": session.game_id, "player": PLAYERS[side][0],
+                 "start": move[0], "end": move[1], "count": move[2], "winner": session.winner,
+                 "delta": encode_delta(session.delta, game.get_rules()).hex()}
+        send(session.clients[other], event)
+        if not session.is_over() and session.bot is not None and other == 1:
+            self.schedule_bot(session)
+
+    def schedule_bot(self, session):
+        """
+        Starts a task searching the bot move in the pool
+        """
+        session.thinking = True
+        asyncio.get_running_loop().create_task(self.bot_turn(session))
+
+    async def bot_turn(self, session):
+        """
+        Waits for the bot move from the process pool and
+        makes it, a bot with no legal move loses and
+        a bot that fails ends the session with an error
+        """
+        game = session.game
+        name = PLAYERS[1][0]
+        session.seed += 1
+        try:
+            move = await asyncio.get_running_loop().run_in_executor(
+                self._pool, bot_move, session.bot, name, game.to_bytes(), game.get_rules(), session.seed)
+        except Exception:
+            logger.exception("bot %s failed in game %s", session.bot, session.game_id)
+            if self._sessions.pop(session.game_id, None) is session:
+                send(session.clients[0], {"event": "error", "game": session.game_id,
+                                          "error": "bot failed, the game is closed"})
+            return
+        finally:
+            session.thinking = False
+        if self._sessions.get(session.game_id) is not session:
+            return
+        if move is None:
+            session.winner = PLAYERS[0][0]
+            send(session.clients[0], {"event": "resign", "game": session.game_id, "winner": session.winner})
+            return
+        game.apply_move(name, move)
+        self.moved(session, 1, move)
+
+    def leave(self, session, writer):
+        """
+        Removes the client from the session, the
+        session ends once no human is seated
+        """
+        if writer in session.clients:
+            side = session.clients.index(writer)
+            session.clients[side] = None
+            send(session.clients[1 - side], {"event": "left", "game": session.game_id,
+                                             "player": PLAYERS[side][0]})
+        if session.clients == [None, None]:
+            self._sessions.pop(session.game_id, None)
+
+
+async def serve(host, port, workers):
+    server = GameServer(workers)
+    listener = await server.start(host, port)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host FocusGame matches over TCP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=None, help="processes for bot moves")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+# Batch self-play simulator for FocusGame
+#
+# to run:
+# python3 simulate.py --games 100000 --p1 random --p2 greedy --out results.jsonl
+
+# Required Moduels
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from FocusGame import FocusGame
+from search import AlphaBetaPlayer, evaluate, WIN_SCORE
+from mcts import MCTSPlayer
+
+PLAYERS = (("p1", "R"), ("p2", "G"))
+
+# longest game before it is scored as a draw
+MAX_GAME_MOVES = 400
+
+RESULT_FIELDS = ["game", "seed", "first", "winner", "reason", "length",
+                 "p1_captured", "p2_captured", "p1_reserve_moves", "p2_reserve_moves"]
+
+
+class RandomPolicy:
+    """
+    Represents a player choosing uniformly
+    among the legal moves
+    """
+
+    def __init__(self, name, rng):
+        """
+        Creates the policy for the player name
+        """
+        self._name = name
+        self._random = rng
+
+    def get_name(self):
+        """
+        returns the name of the player
+        """
+        return self._name
+
+    def choose_move(self, game):
+        """
+        Returns a random legal move, or None
+        """
+        moves = list(game.legal_moves(self._name))
+        if len(moves) == 0:
+            return None
+        return moves[self._random.randrange(len(moves))]
+
+
+class GreedyPolicy:
+    """
+    Represents a player choosing the move with
+    the best evaluation one move ahead
+    """
+
+    def __init__(self, name, rng):
+        """
+        Creates the policy for the player name
+        """
+        self._name = name
+        self._random = rng
+
+    def get_name(self):
+        """
+        returns the name of the player
+        """
+        return self._name
+
+    def choose_move(self, game):
+        """
+        Returns the best scoring legal move,
+        ties are broken at random
+        """
+        best_moves = []
+        best_score = None
+        for move in list(game.legal_moves(self._name)):
+            game.apply_move(self._name, move)
+            if game.is_game_over():
+                score = WIN_SCORE
+            else:
+                score = evaluate(game, self._name)
+            game.undo_move()
+            if best_score is None or score > best_score:
+                best_moves = [move]
+                best_score = score
+            elif score == best_score:
+                best_moves.append(move)
+        if len(best_moves) == 0:
+            return None
+        return best_moves[self._random.randrange(len(best_moves))]
+
+
+def make_policy(spec, name, seed):
+    """
+    Returns the policy for a spec string, one of
+    random, greedy, search[:seconds] or mcts[:playouts]
+    """
+    kind, _, argument = spec.partition(":")
+    rng = random.Random(seed)
+    if kind == "random":
+        return RandomPolicy(name, rng)
+    if kind == "greedy":
+        return GreedyPolicy(name, rng)
+    if kind == "search":
+        return AlphaBetaPlayer(name, float(argument or 0.05))
+    if kind == "mcts":
+        return MCTSPlayer(name, int(argument or 200), seed=seed)
+    raise ValueError("unknown policy {}".format(spec))
+
+
+def play_game(p1_spec, p2_spec, seed, first=0, max_moves=MAX_GAME_MOVES, record_moves=False):
+    """
+    Plays one game between the two policies and
+    returns a dict with the result, first is the
+    index of the player making the first move
+    """
+    game = FocusGame(*PLAYERS)
+    rng = random.Random(seed)
+    policies = [make_policy(p1_spec, PLAYERS[0][0], rng.getrandbits(32)),
+                make_policy(p2_spec, PLAYERS[1][0], rng.getrandbits(32))]
+    reserve_moves = [0, 0]
+    moves = []
+    side = first
+    winner = None
+    reason = "max_moves"
+    length = 0
+    while length < max_moves:
+        move = policies[side].choose_move(game)
+        if move is None:
+            winner = PLAYERS[1 - side][0]
+            reason = "no_moves"
+            break
+        game.apply_move(PLAYERS[side][0], move)
+        length += 1
+        if move[0] is None:
+            reserve_moves[side] += 1
+        if record_moves:
+            moves.append(move)
+        if game.is_game_over():
+            winner = PLAYERS[side][0]
+            reason = "captures"
+            break
+        side = 1 - side
+
+    result = {
+        "seed": seed,
+        "first": PLAYERS[first][0],
+        "winner": winner,
+        "reason": reason,
+        "length": length,
+        "p1_captured": game.show_captured(PLAYERS[0][0]),
+        "p2_captured": game.show_captured(PLAYERS[1][0]),
+        "p1_reserve_moves": reserve_moves[0],
+        "p2_reserve_moves": reserve_moves[1],
+    }
+    if record_moves:
+        result["moves"] = moves
+    return result
+
+
+def play_games(first_game, count, p1_spec, p2_spec, seed, max_moves, record_moves):
+    """
+    Plays a chunk of games in a worker process and
+    returns their results, game i uses seed + i and
+    the first move alternates between the players
+    """
+    results = []
+    for game_index in range(first_game, first_game + count):
+        result = play_game(p1_spec, p2_spec, seed + game_index, game_index % 2,
+                           max_moves, record_moves)
+        result["game"] = game_index
+        results.append(result)
+    return results
+
+
+class ResultWriter:
+    """
+    Represents a sink streaming game results
+    to a JSONL or CSV file (chosen by extension)
+    """
+
+    def __init__(self, path):
+        """
+        Opens the file at the path, "-" writes
+        JSONL to standard output
+        """
+        if path == "-":
+            self._file = sys.stdout
+        else:
+            self._file = open(path, "w", newline="")
+        self._csv = None
+        if path.endswith(".csv"):
+            self._csv = csv.DictWriter(self._file, RESULT_FIELDS + ["moves"], extrasaction="ignore")
+            self._csv.writeheader()
+
+    def write(self, result):
+        """
+        Writes one game result
+        """
+        if self._csv is not None:
+            row = dict(result)
+            if "moves" in row:
+                row["moves"] = json.dumps(row["moves"])
+            self._csv.writerow(row)
+        else:
+            self._file.write(json.dumps(result))
+            self._file.write("\n")
+
+    def close(self):
+        """
+        Closes the file
+        """
+        if self._file is not sys.stdout:
+            self._file.close()
+
+
+def simulate(games, p1_spec, p2_spec, out="-", workers=None, seed=0, chunk_size=64,
+             max_moves=MAX_GAME_MOVES, record_moves=False, report=sys.stderr):
+    """
+    Plays the number of games across a process pool,
+    streaming every result to the output as it arrives.
+    Only a few chunks per worker are in flight at once
+    so memory stays constant however many games are run.
+    Returns a dict with the wins, draws and games/sec
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    writer = ResultWriter(out)
+    summary = {"games": 0, "p1": 0, "p2": 0, "draws": 0}
+    start_time = time.perf_counter()
+    next_report = start_time + 10
+    chunks = ((first, min(chunk_size, games - first)) for first in range(0, games, chunk_size))
+
+    with ProcessPoolExecutor(workers) as executor:
+        pending = set()
+        while True:
+            # keep two chunks per worker in flight
+            for first, count in chunks:
+                pending.add(executor.submit(play_games, first, count, p1_spec, p2_spec, seed,
+                                            max_moves, record_moves))
+                if len(pending) >= 2 * workers:
+                    break
+            if len(pending) == 0:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for result in future.result():
+                    writer.write(result)
+                    summary["games"] += 1
+                    summary[result["winner"] or "draws"] += 1
+
+            now = time.perf_counter()
+            if report is not None and now >= next_report:
+                print("{} games, {:.1f} games/sec".format(summary["games"], summary["games"] / (now - start_time)),
+                      file=report)
+                next_report = now + 10
+
+    writer.close()
+    elapsed = time.perf_counter() - start_time
+    summary["seconds"] = elapsed
+    summary["games_per_sec"] = summary["games"] / elapsed if elapsed > 0 else 0.0
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play FocusGame games between two policies")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--p1", default="random", help="random, greedy, search[:seconds] or mcts[:playouts]")
+    parser.add_argument("--p2", default="random", help="random, greedy, search[:seconds] or mcts[:playouts]")
+    parser.add_argument("--out", default="-", help="results file (.jsonl or .csv), - for stdout")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=64)
+    parser.add_argument("--max-moves", type=int, default=MAX_GAME_MOVES)
+    parser.add_argument("--record-moves", action="store_true")
+    args = parser.parse_args()
+
+    summary = simulate(args.games, args.p1, args.p2, args.out, args.workers, args.seed,
+                       args.chunk_size, args.max_moves, args.record_moves)
+    print("{games} games | p1 wins: {p1} | p2 wins: {p2} | draws: {draws} | "
+          "{games_per_sec:.1f} games/sec".format(**summary), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
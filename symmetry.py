@@ -0,0 +1,271 @@
+# Symmetries of FocusGame positions: the 8 rotations and
+# reflections of the board, each with or without swapping the
+# two players, map positions to positions with the same value.
+# Position keyed caches and datasets can store one canonical
+# representative for all 16 variants
+
+# Required Moduels
+from operator import itemgetter
+from array import array
+
+from FocusGame import STANDARD_RULES, NO_TURN, MAX_TABLE_BITS, LazyTable
+
+# transform t is board symmetry t % 8, players swapped when t >= 8
+NUM_TRANSFORMS = 16
+BOARD_TRANSFORMS = 8
+
+
+def board_transforms(board_size):
+    """
+    Returns the 8 board symmetries as lists mapping every
+    square to its image: identity, rotations by 90, 180 and
+    270 degrees, then reflections of the rows, the columns
+    and the two diagonals
+    """
+    n = board_size - 1
+    maps = (
+        lambda x, y: (x, y),
+        lambda x, y: (y, n - x),
+        lambda x, y: (n - x, n - y),
+        lambda x, y: (n - y, x),
+        lambda x, y: (n - x, y),
+        lambda x, y: (x, n - y),
+        lambda x, y: (y, x),
+        lambda x, y: (n - y, n - x),
+    )
+    transforms = []
+    for mapping in maps:
+        images = []
+        for square in range(board_size * board_size):
+            x, y = mapping(*divmod(square, board_size))
+            images.append(x * board_size + y)
+        transforms.append(images)
+    return transforms
+
+
+class SymmetryTables:
+    """
+    Represents the lookup tables of the symmetries
+    of positions under one set of GameRules
+    """
+
+    def __init__(self, rules):
+        """
+        Builds the square, color swap, action
+        and inverse tables for the rules
+        """
+        self._rules = rules
+        squares = rules.get_board_size() ** 2
+        self.squares = squares
+        self.square_maps = board_transforms(rules.get_board_size())
+
+        # new_cells[image] = cells[square], so every transform is
+        # one itemgetter over the cells of the inverse square map
+        self.gathers = []
+        for images in self.square_maps:
+            sources = [0] * squares
+            for square, image in enumerate(images):
+                sources[image] = square
+            self.gathers.append(itemgetter(*sources))
+
+        # swapping the players flips the color bits below the height,
+        # the table is filled as stacks are seen for wide stacks and
+        # padded to the 256 entries of bytes.translate for byte stacks
+        cell_bits = rules.height_bits + rules.get_stack_limit()
+        if cell_bits > MAX_TABLE_BITS:
+            self.color_swap = LazyTable(self._swap_colors)
+        else:
+            self.color_swap = [self._swap_colors(cell) for cell in range(1 << cell_bits)]
+        self.color_swap_bytes = None
+        if rules.typecode == "B":
+            self.color_swap_bytes = bytes(self.color_swap) + bytes(range(1 << cell_bits, 256))
+
+        # actions: the start and end squares move with the board,
+        # the number of pawns (and so the distance) is kept
+        self.action_maps = []
+        for t in range(NUM_TRANSFORMS):
+            images = self.square_maps[t % BOARD_TRANSFORMS]
+            actions = array("H")
+            for action in range(rules.num_actions):
+                start_pos, end_pos, num_pawns = rules.index_to_move(action)
+                if start_pos is None:
+                    location = images[end_pos[0] * rules.get_board_size() + end_pos[1]]
+                    actions.append(rules.reserve_actions + location)
+                else:
+                    actions.append(self._map_stack_action(images, start_pos, end_pos, num_pawns))
+            self.action_maps.append(actions)
+
+        # the inverse of every transform
+        self.inverses = []
+        for t in range(NUM_TRANSFORMS):
+            images = self.square_maps[t % BOARD_TRANSFORMS]
+            for u in range(NUM_TRANSFORMS):
+                back = self.square_maps[u % BOARD_TRANSFORMS]
+                if (t >= BOARD_TRANSFORMS) == (u >= BOARD_TRANSFORMS) and \
+                        all(back[images[square]] == square for square in range(squares)):
+                    self.inverses.append(u)
+                    break
+
+    def _swap_colors(self, cell):
+        """
+        Returns the packed stack with the colors of its pawns
+        swapped, heights past the stack limit never occur and
+        only keep the table within the cell range
+        """
+        rules = self._rules
+        height = min(cell & rules.height_mask, rules.get_stack_limit())
+        return cell ^ (((1 << height) - 1) << rules.height_bits)
+
+    def _map_stack_action(self, images, start_pos, end_pos, num_pawns):
+        """
+        Returns the action number of a stack move moved
+        by the square map, or the action itself when the
+        move leaves the board (it has no image)
+        """
+        rules = self._rules
+        size = rules.get_board_size()
+        if not (0 <= end_pos[0] < size and 0 <= end_pos[1] < size):
+            return rules.move_to_index((start_pos, end_pos, num_pawns))
+        start = divmod(images[start_pos[0] * size + start_pos[1]], size)
+        end = divmod(images[end_pos[0] * size + end_pos[1]], size)
+        return rules.move_to_index((start, end, num_pawns))
+
+
+_tables = {}
+
+
+def get_tables(rules=STANDARD_RULES):
+    """
+    Returns the SymmetryTables of the rules,
+    built the first time they are asked for
+    """
+    tables = _tables.get(rules)
+    if tables is None:
+        tables = SymmetryTables(rules)
+        _tables[rules] = tables
+    return tables
+
+
+def inverse(transform, rules=STANDARD_RULES):
+    """
+    Returns the transform undoing the transform
+    """
+    return get_tables(rules).inverses[transform]
+
+
+def transform_record(record, transform, rules=STANDARD_RULES):
+    """
+    Returns the to_bytes record of the position
+    moved by the transform
+    """
+    tables = get_tables(rules)
+    counters = rules.record_size - 6
+    swap = transform >= BOARD_TRANSFORMS
+    if rules.typecode == "B":
+        cells = bytes(tables.gathers[transform % BOARD_TRANSFORMS](record))
+        if swap:
+            cells = cells.translate(tables.color_swap_bytes)
+    else:
+        values = tables.gathers[transform % BOARD_TRANSFORMS](array(rules.typecode, bytes(record[:counters])))
+        if swap:
+            values = [tables.color_swap[value] for value in values]
+        cells = array(rules.typecode, values).tobytes()
+    return cells + transform_counters(record[counters:counters + 6], swap)
+
+
+def transform_counters(counters, swap):
+    """
+    Returns the reserve, capture, turn and game over
+    bytes of a record, with the players swapped if asked
+    """
+    reserve_1, reserve_2, captured_1, captured_2, turn, game_over = counters
+    if not swap:
+        return bytes(counters)
+    if turn != NO_TURN:
+        turn ^= 1
+    return bytes((reserve_2, reserve_1, captured_2, captured_1, turn, game_over))
+
+
+def canonical_record(record, rules=STANDARD_RULES):
+    """
+    Returns (canonical record, transform) for a to_bytes
+    record, the canonical record being the smallest of the
+    16 transformed records and transform the one making it
+    """
+    if rules.typecode != "B":
+        candidates = [(transform_record(record, t, rules), t) for t in range(NUM_TRANSFORMS)]
+        return min(candidates)
+    tables = get_tables(rules)
+    counters = rules.record_size - 6
+    swap_bytes = tables.color_swap_bytes
+    plain = bytes(record[counters:counters + 6])
+    swapped = transform_counters(plain, True)
+    best = None
+    best_transform = 0
+    for t, gather in enumerate(tables.gathers):
+        cells = bytes(gather(record))
+        candidate = cells + plain
+        if best is None or candidate < best:
+            best = candidate
+            best_transform = t
+        candidate = cells.translate(swap_bytes) + swapped
+        if candidate < best:
+            best = candidate
+            best_transform = t + BOARD_TRANSFORMS
+    return best, best_transform
+
+
+def record_hash(record, rules=STANDARD_RULES):
+    """
+    Returns the Zobrist hash of the position of a
+    to_bytes record, the same as FocusGame.get_hash
+    of the game restored from it
+    """
+    counters = rules.record_size - 6
+    if rules.typecode == "B":
+        cells = record[:counters]
+    else:
+        cells = array(rules.typecode, bytes(record[:counters]))
+    zobrist = 0
+    for square, cell in enumerate(cells):
+        zobrist ^= rules.stack_keys[square][cell]
+    reserve_1, reserve_2, captured_1, captured_2, turn, game_over = record[counters:counters + 6]
+    zobrist ^= rules.reserve_keys[0][reserve_1] ^ rules.reserve_keys[1][reserve_2]
+    zobrist ^= rules.captured_keys[0][captured_1] ^ rules.captured_keys[1][captured_2]
+    if turn != NO_TURN:
+        zobrist ^= rules.turn_keys[turn]
+    return zobrist
+
+
+def canonicalize(game):
+    """
+    Returns (canonical record, transform) for
+    the position of a FocusGame
+    """
+    return canonical_record(game.to_bytes(), game.get_rules())
+
+
+def canonical_hash(game):
+    """
+    Returns the hash of the canonical position, the same
+    for all the symmetric variants of the position, to key
+    caches and datasets
+    """
+    return record_hash(canonicalize(game)[0], game.get_rules())
+
+
+def transform_action(action, transform, rules=STANDARD_RULES):
+    """
+    Returns the action number of a move moved by
+    the transform (see GameRules.move_to_index)
+    """
+    return get_tables(rules).action_maps[transform][action]
+
+
+def transform_move(move, transform, rules=STANDARD_RULES):
+    """
+    Returns a move given as (start_pos, end_pos,
+    num_pawns) or (None, location, 1) moved by
+    the transform
+    """
+    return rules.index_to_move(transform_action(rules.move_to_index(move), transform, rules))
@@ -0,0 +1,240 @@
+# Endgame tablebase for FocusGame positions with few stacks
+#
+# to generate (2 stacks of up to 3 pawns, one capture from winning):
+# python3 tablebase.py endgame.tb --stacks 2 --height 3 --min-captures 5
+
+# Required Moduels
+import argparse
+import itertools
+import mmap
+import struct
+from collections import deque
+
+from FocusGame import FocusGame, BOARD_SIZE, HEIGHT_BITS, STACK_LIMIT
+from simulate import PLAYERS
+
+WIN = 1
+LOSS = -1
+
+# file header: magic, version and entry count
+HEADER = struct.Struct("<5sBI")
+MAGIC = b"FOCTB"
+VERSION = 1
+
+# entry: position hash, result for the side to move, plies to the end
+ENTRY = struct.Struct("<QbH")
+KEY = struct.Struct("<Q")
+
+
+def stack_values(max_height):
+    """
+    Returns every packed stack of 1 to max_height pawns
+    """
+    values = []
+    for height in range(1, max_height + 1):
+        for colors in range(1 << height):
+            values.append((colors << HEIGHT_BITS) | height)
+    return values
+
+
+def enumerate_positions(max_stacks, max_height, max_reserve, min_captures):
+    """
+    Generates the to_bytes records of every position with
+    at most max_stacks stacks of at most max_height pawns,
+    reserves up to max_reserve and captures between
+    min_captures and 5 for both players, either side to move
+    """
+    squares = BOARD_SIZE * BOARD_SIZE
+    stacks = stack_values(max_height)
+    counters = [(r1, r2, c1, c2)
+                for r1 in range(max_reserve + 1) for r2 in range(max_reserve + 1)
+                for c1 in range(min_captures, 6) for c2 in range(min_captures, 6)]
+    for num_stacks in range(1, max_stacks + 1):
+        for occupied in itertools.combinations(range(squares), num_stacks):
+            for values in itertools.product(stacks, repeat=num_stacks):
+                cells = bytearray(squares)
+                for square, value in zip(occupied, values):
+                    cells[square] = value
+                for reserve_1, reserve_2, captured_1, captured_2 in counters:
+                    for turn in (0, 1):
+                        yield bytes(cells) + bytes((reserve_1, reserve_2, captured_1, captured_2, turn, 0))
+
+
+def solve(max_stacks=2, max_height=3, max_reserve=0, min_captures=5):
+    """
+    Solves every position of the class by retrograde analysis
+    and returns a dict of position hash to (result, plies)
+    for the positions with a proven result, result being
+    WIN or LOSS for the player to move. A player without a
+    legal move loses, as in simulate.py. Moves leaving the
+    class count as unknown, so they never prove a loss
+    """
+    game = FocusGame(*PLAYERS)
+    records = list(enumerate_positions(max_stacks, max_height, max_reserve, min_captures))
+    ids = {record: index for index, record in enumerate(records)}
+    keys = [0] * len(records)
+    results = [0] * len(records)
+    plies = [0] * len(records)
+    unresolved_moves = [0] * len(records)
+    parents = [[] for record in records]
+    lost = []
+    won_now = []
+
+    # expand every position once
+    for index, record in enumerate(records):
+        game.restore_bytes(record)
+        keys[index] = game.get_hash()
+        player = game.whos_turn_is_it()
+        moves = list(game.legal_moves(player))
+        if len(moves) == 0:
+            results[index] = LOSS
+            lost.append(index)
+            continue
+        for move in moves:
+            game.apply_move(player, move)
+            won = game.is_game_over()
+            child = ids.get(game.to_bytes())
+            game.undo_move()
+            if won:
+                results[index] = WIN
+                plies[index] = 1
+                break
+            unresolved_moves[index] += 1
+            if child is not None:
+                parents[child].append(index)
+        if results[index] == WIN:
+            won_now.append(index)
+
+    # propagate results back through the parents in order of plies
+    queue = deque(lost + won_now)
+    while queue:
+        index = queue.popleft()
+        for parent in parents[index]:
+            if results[parent] != 0:
+                continue
+            if results[index] == LOSS:
+                results[parent] = WIN
+                plies[parent] = plies[index] + 1
+                queue.append(parent)
+            else:
+                unresolved_moves[parent] -= 1
+                if unresolved_moves[parent] == 0:
+                    results[parent] = LOSS
+                    plies[parent] = plies[index] + 1
+                    queue.append(parent)
+
+    return {keys[index]: (results[index], plies[index])
+            for index in range(len(records)) if results[index] != 0}
+
+
+def write_tablebase(path, solved):
+    """
+    Writes solved positions sorted by hash,
+    returns the number of entries written
+    """
+    with open(path, "wb") as table:
+        table.write(HEADER.pack(MAGIC, VERSION, len(solved)))
+        for key in sorted(solved):
+            result, plies = solved[key]
+            table.write(ENTRY.pack(key, result, plies))
+    return len(solved)
+
+
+class Tablebase:
+    """
+    Represents a memory mapped tablebase of solved
+    positions sorted by position hash
+    """
+
+    def __init__(self, path):
+        """
+        Maps the tablebase file at the path
+        """
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("{} is not a version {} tablebase".format(path, VERSION))
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def probe(self, game):
+        """
+        Returns (WIN or LOSS for the player to move, plies
+        to the end) for the position, None if not solved
+        """
+        key = game.get_hash()
+        low = 0
+        high = self._count
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(self._map, HEADER.size + middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count:
+            entry_key, result, plies = ENTRY.unpack_from(self._map, HEADER.size + low * ENTRY.size)
+            if entry_key == key:
+                return result, plies
+        return None
+
+    def best_move(self, game):
+        """
+        Returns the move keeping the best result for the
+        player to move (fastest win, slowest loss), or
+        None if the position is not in the tablebase
+        """
+        entry = self.probe(game)
+        player = game.whos_turn_is_it()
+        if entry is None or player is None:
+            return None
+        best = None
+        best_plies = None
+        for move in list(game.legal_moves(player)):
+            game.apply_move(player, move)
+            if game.is_game_over():
+                game.undo_move()
+                return move
+            child = self.probe(game)
+            game.undo_move()
+            if child is None:
+                continue
+            if entry[0] == WIN and child[0] == LOSS:
+                if best_plies is None or child[1] < best_plies:
+                    best, best_plies = move, child[1]
+            elif entry[0] == LOSS and child[0] == WIN:
+                if best_plies is None or child[1] > best_plies:
+                    best, best_plies = move, child[1]
+        return best
+
+    def close(self):
+        """
+        Releases the map and closes the file
+        """
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate an endgame tablebase")
+    parser.add_argument("path", help="tablebase file to write")
+    parser.add_argument("--stacks", type=int, default=2, help="most stacks on the board")
+    parser.add_argument("--height", type=int, default=3, help="tallest stack, up to {}".format(STACK_LIMIT))
+    parser.add_argument("--reserve", type=int, default=0, help="largest reserve per player")
+    parser.add_argument("--min-captures", type=int, default=5, help="fewest captures per player")
+    args = parser.parse_args()
+    solved = solve(args.stacks, args.height, args.reserve, args.min_captures)
+    print("{} positions solved".format(write_tablebase(args.path, solved)))
+
+
+if __name__ == "__main__":
+    main()
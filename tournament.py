@@ -0,0 +1,323 @@
+# Round-robin and gauntlet tournaments between FocusGame policies
+# with Elo estimates and SPRT early stopping
+#
+# to run every pair of policies for up to 1000 games each:
+# python3 tournament.py random greedy search:0.01 --games 1000
+# to test a candidate against the others and stop a pairing once
+# SPRT settles whether it is elo0 or elo1 stronger:
+# python3 tournament.py search:0.02 search:0.01 mcts:200 --gauntlet --elo0 0 --elo1 30
+
+# Required Moduels
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import combinations
+
+from simulate import PLAYERS, MAX_GAME_MOVES, make_policy, play_games
+
+# z score of the reported Elo confidence intervals (95%)
+CONFIDENCE_Z = 1.96
+
+# SPRT outcomes of a pairing
+H0 = "H0"
+H1 = "H1"
+
+
+def score_to_elo(score):
+    """
+    Returns the Elo difference expected to give
+    the score (1 is a win, 0.5 a draw per game)
+    """
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+
+def elo_to_score(elo):
+    """
+    Returns the score expected at an Elo difference
+    """
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+class Pairing:
+    """
+    Represents the games between two policy specs,
+    counted from the first spec's side: its wins,
+    losses and draws, with the first move alternating
+    so both play first equally often
+    """
+
+    def __init__(self, index, first_spec, second_spec):
+        """
+        Creates the pairing with no games played
+        """
+        self.index = index
+        self.specs = (first_spec, second_spec)
+        self.wins = 0
+        self.losses = 0
+        self.draws = 0
+        self.decision = None
+        self.submitted = 0
+
+    def add(self, result):
+        """
+        Counts a game result made by simulate.play_game
+        """
+        if result["winner"] is None:
+            self.draws += 1
+        elif result["winner"] == PLAYERS[0][0]:
+            self.wins += 1
+        else:
+            self.losses += 1
+
+    def get_games(self):
+        """
+        Returns the number of games counted
+        """
+        return self.wins + self.losses + self.draws
+
+    def get_score(self):
+        """
+        Returns the mean score of the first spec
+        """
+        return (self.wins + 0.5 * self.draws) / self.get_games()
+
+    def _smoothed(self):
+        """
+        Returns (games, score, variance) with half a win
+        and half a loss added, so a one sided pairing
+        still has a variance to bound its Elo and settle
+        """
+        wins = self.wins + 0.5
+        losses = self.losses + 0.5
+        games = self.get_games() + 1
+        score = (wins + 0.5 * self.draws) / games
+        variance = (wins * (1 - score) ** 2 + self.draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+        return games, score, variance
+
+    def get_elo(self):
+        """
+        Returns (elo, low, high), the Elo difference of
+        the first spec over the second with its confidence
+        interval, None before any game
+        """
+        if self.get_games() == 0:
+            return None
+        games, score, variance = self._smoothed()
+        margin = CONFIDENCE_Z * math.sqrt(variance / games)
+        return (score_to_elo(self.get_score()), score_to_elo(score - margin), score_to_elo(score + margin))
+
+    def get_llr(self, elo0, elo1):
+        """
+        Returns the log likelihood ratio of the first spec
+        being elo1 rather than elo0 stronger, from the
+        normal approximation of the game scores
+        """
+        if self.get_games() == 0:
+            return 0.0
+        games, score, variance = self._smoothed()
+        score0 = elo_to_score(elo0)
+        score1 = elo_to_score(elo1)
+        return games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+
+    def update_decision(self, elo0, elo1, alpha, beta):
+        """
+        Settles the pairing as H0 or H1 once the log
+        likelihood ratio leaves the SPRT bounds for the
+        error rates alpha and beta, returns the decision
+        """
+        if self.decision is None:
+            llr = self.get_llr(elo0, elo1)
+            if llr <= math.log(beta / (1 - alpha)):
+                self.decision = H0
+            elif llr >= math.log((1 - beta) / alpha):
+                self.decision = H1
+        return self.decision
+
+    def to_dict(self):
+        """
+        Returns the pairing as a dict for reports, an
+        Elo that is not finite (a one sided pairing) is None
+        """
+        elo = self.get_elo()
+        if elo is None:
+            elo = (None, None, None)
+        elo = [value if value is not None and math.isfinite(value) else None for value in elo]
+        return {"first": self.specs[0], "second": self.specs[1], "games": self.get_games(),
+                "wins": self.wins, "losses": self.losses, "draws": self.draws,
+                "elo": elo[0], "elo_low": elo[1], "elo_high": elo[2],
+                "sprt": self.decision}
+
+
+def round_robin(specs):
+    """
+    Returns every pair of the policy specs
+    """
+    return list(combinations(specs, 2))
+
+
+def gauntlet(candidate, opponents):
+    """
+    Returns the candidate spec paired
+    with each of the opponent specs
+    """
+    return [(candidate, opponent) for opponent in opponents]
+
+
+def fit_ratings(pairings, iterations=200):
+    """
+    Returns a dict of Elo ratings for every spec of the
+    pairings fitted to all their games (draws count half
+    a win, and every pairing gets one more drawn game so
+    a spec that never scored or never lost stays finite),
+    the first spec of the first pairing is rated 0
+    """
+    specs = []
+    for pairing in pairings:
+        for spec in pairing.specs:
+            if spec not in specs:
+                specs.append(spec)
+    strength = dict.fromkeys(specs, 1.0)
+    for iteration in range(iterations):
+        # minorization-maximization update of the Bradley-Terry strengths
+        updated = {}
+        for spec in specs:
+            won = 0.0
+            weight = 0.0
+            for pairing in pairings:
+                if spec not in pairing.specs:
+                    continue
+                other = pairing.specs[1] if pairing.specs[0] == spec else pairing.specs[0]
+                points = pairing.wins + 0.5 * pairing.draws
+                if pairing.specs[0] != spec:
+                    points = pairing.get_games() - points
+                won += points + 0.5
+                weight += (pairing.get_games() + 1) / (strength[spec] + strength[other])
+            updated[spec] = won / weight
+        strength = updated
+    anchor = strength[specs[0]] if specs else 1.0
+    return {spec: 400 * math.log10(strength[spec] / anchor) for spec in specs}
+
+
+def run_tournament(pairs, max_games=1000, workers=None, seed=0, chunk_size=16, elo0=None, elo1=None,
+                   alpha=0.05, beta=0.05, max_moves=MAX_GAME_MOVES, report=sys.stderr):
+    """
+    Plays up to max_games games for every pair of policy
+    specs across a process pool and returns the list of
+    Pairing. Chunks of every unsettled pairing are kept
+    in flight together, a pairing stops being scheduled
+    once SPRT (when elo0 and elo1 are given) settles it,
+    games already in flight are still counted
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    # chunks hold whole pairs of games, one with each first mover
+    chunk_size += chunk_size % 2
+    pairings = [Pairing(index, first, second) for index, (first, second) in enumerate(pairs)]
+    start_time = time.perf_counter()
+    next_report = start_time + 10
+
+    def schedulable():
+        return [p for p in pairings if p.decision is None and p.submitted < max_games]
+
+    with ProcessPoolExecutor(workers) as executor:
+        pending = {}
+        turn = 0
+        while True:
+            # keep two chunks per worker in flight, taking
+            # the unsettled pairings in turn
+            candidates = schedulable()
+            while len(pending) < 2 * workers and len(candidates) > 0:
+                pairing = candidates[turn % len(candidates)]
+                turn += 1
+                count = min(chunk_size, max_games - pairing.submitted)
+                future = executor.submit(play_games, pairing.submitted, count, pairing.specs[0],
+                                         pairing.specs[1], seed + pairing.index * max_games, max_moves, False)
+                pending[future] = pairing
+                pairing.submitted += count
+                candidates = schedulable()
+            if len(pending) == 0:
+                break
+            done = wait(pending, return_when=FIRST_COMPLETED)[0]
+            for future in done:
+                pairing = pending.pop(future)
+                for result in future.result():
+                    pairing.add(result)
+                if elo0 is not None and elo1 is not None:
+                    pairing.update_decision(elo0, elo1, alpha, beta)
+
+            now = time.perf_counter()
+            if report is not None and now >= next_report:
+                played = sum(p.get_games() for p in pairings)
+                settled = sum(1 for p in pairings if p.decision is not None)
+                print("{} games, {} of {} pairings settled, {:.1f} games/sec".format(
+                    played, settled, len(pairings), played / (now - start_time)), file=report)
+                next_report = now + 10
+    return pairings
+
+
+def format_elo(elo):
+    """
+    Returns an Elo value for a report
+    """
+    if math.isinf(elo):
+        return "+inf" if elo > 0 else "-inf"
+    return "{:+d}".format(round(elo))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play a tournament between FocusGame policies")
+    parser.add_argument("specs", nargs="+", help="random, greedy, search[:seconds] or mcts[:playouts]")
+    parser.add_argument("--gauntlet", action="store_true", help="pair the first spec with each other one")
+    parser.add_argument("--games", type=int, default=1000, help="most games per pairing")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=16)
+    parser.add_argument("--max-moves", type=int, default=MAX_GAME_MOVES)
+    parser.add_argument("--elo0", type=float, default=None, help="SPRT null hypothesis Elo")
+    parser.add_argument("--elo1", type=float, default=None, help="SPRT alternative hypothesis Elo")
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    parser.add_argument("--out", default=None, help="write the pairings and ratings as JSON")
+    args = parser.parse_args()
+    if len(args.specs) < 2:
+        parser.error("at least two policy specs are needed")
+    if (args.elo0 is None) != (args.elo1 is None):
+        parser.error("--elo0 and --elo1 go together")
+    try:
+        for spec in args.specs:
+            make_policy(spec, PLAYERS[0][0], 0)
+    except ValueError as error:
+        parser.error(str(error))
+
+    if args.gauntlet:
+        pairs = gauntlet(args.specs[0], args.specs[1:])
+    else:
+        pairs = round_robin(args.specs)
+    pairings = run_tournament(pairs, args.games, args.workers, args.seed, args.chunk_size,
+                              args.elo0, args.elo1, args.alpha, args.beta, args.max_moves)
+
+    for pairing in pairings:
+        elo, low, high = pairing.get_elo()
+        print("{} vs {}: +{} -{} ={} | Elo {} [{}, {}]{}".format(
+            pairing.specs[0], pairing.specs[1], pairing.wins, pairing.losses, pairing.draws,
+            format_elo(elo), format_elo(low), format_elo(high),
+            "" if pairing.decision is None else " | SPRT " + pairing.decision))
+    ratings = fit_ratings(pairings)
+    for spec, rating in sorted(ratings.items(), key=lambda item: -item[1]):
+        print("{:<20} {}".format(spec, format_elo(rating)))
+    if args.out is not None:
+        with open(args.out, "w") as out:
+            json.dump({"pairings": [pairing.to_dict() for pairing in pairings], "ratings": ratings}, out,
+                      indent=2, allow_nan=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# Transposition table for FocusGame positions
+
+# Required Moduels
+
+# bound stored with a value
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+
+class TranspositionTable:
+    """
+    Represents a fixed size table of results keyed
+    by the Zobrist hash of a position (FocusGame.get_hash).
+    Every bucket has two slots: the first keeps the deepest
+    result of the current search and the second always
+    takes the newest result, so the table never grows
+    """
+
+    def __init__(self, size_bits=20):
+        """
+        Creates a table with 2 ** size_bits buckets
+        """
+        self._mask = (1 << size_bits) - 1
+        self._slots = [None] * (2 << size_bits)
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+
+    def new_search(self):
+        """
+        Starts a new search, results of older
+        searches are replaced first
+        """
+        self._generation += 1
+
+    def lookup(self, key):
+        """
+        Returns the (depth, value, bound, move) entry
+        stored for the key, or None if there is none
+        """
+        index = (key & self._mask) << 1
+        for entry in (self._slots[index], self._slots[index + 1]):
+            if entry is not None and entry[0] == key:
+                self._hits += 1
+                return entry[1:5]
+        self._misses += 1
+        return None
+
+    def store(self, key, depth, value, bound=EXACT, move=None):
+        """
+        Stores a result for the key, replacing the
+        deep slot if it holds the same position, a
+        shallower result or one from an older search
+        """
+        index = (key & self._mask) << 1
+        entry = (key, depth, value, bound, move, self._generation)
+        deep = self._slots[index]
+        if (deep is None or deep[0] == key or deep[1] <= depth
+                or deep[5] != self._generation):
+            self._slots[index] = entry
+        else:
+            self._slots[index + 1] = entry
+
+    def clear(self):
+        """
+        Removes every stored result
+        """
+        self._slots = [None] * len(self._slots)
+        self._hits = 0
+        self._misses = 0
+
+    def get_stats(self):
+        """
+        Returns a dict with the number of
+        lookup hits and misses
+        """
+        return {"hits": self._hits, "misses": self._misses}